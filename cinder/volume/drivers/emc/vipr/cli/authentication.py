@@ -29,6 +29,8 @@ from requests.exceptions import Timeout
 import socket
 import json
 import ConfigParser
+import threading
+import time
 
 
 class Authentication(object):
@@ -61,11 +63,28 @@ class Authentication(object):
     
     def authenticate_user(self, username, password, cookiedir, cookiefile):
         '''
-        Makes REST API call to generate the cookiefile for the 
-        specified user after validation.
+        Makes REST API call to generate the auth token for the 
+        specified user after validation. The token is kept in
+        common.TOKENS and, unless cookiedir is None, saved in the cookiefile.
         Returns:
             SUCCESS OR FAILURE
         '''
+        authToken = self.login(username, password)
+
+        common.TOKENS.put(self.__ipAddr, self.__port, authToken)
+        # the token file is only needed by the processes that do not share
+        # this token store, such as the following CLI commands
+        if (cookiedir is None):
+            return username+' : Authenticated Successfully'
+        return self.save_token(username, authToken, cookiedir, cookiefile)
+
+    def login(self, username, password):
+        '''
+        Makes REST API call to generate an auth token for the
+        specified user after validation.
+        Returns:
+            the auth token
+        '''
         SEC_REDIRECT                = 302 
         SEC_AUTHTOKEN_HEADER        = 'X-SDS-AUTH-TOKEN' 
         LB_API_PORT                 = 4443    # Port on which load-balancer/reverse-proxy listens to all incoming requests for ViPR REST APIs
@@ -74,23 +93,24 @@ class Authentication(object):
         cookiejar=cookielib.LWPCookieJar()
 
         url = 'https://'+str(self.__ipAddr)+':'+str(self.__port)+self.URI_AUTHENTICATION
+        session = common.get_session(self.__ipAddr, self.__port)
 
         try:
             if(self.__port == APISVC_PORT):
-                login_response = requests.get(url, headers=self.HEADERS, verify=False,
+                login_response = session.get(url, headers=self.HEADERS, verify=False,
                                           auth=(username,password), cookies=cookiejar, allow_redirects=False, timeout=common.TIMEOUT_SEC)
                 if(login_response.status_code == SEC_REDIRECT):
                     location = login_response.headers['Location'] 
                     if(not location): 
                        raise SOSError(SOSError.HTTP_ERR, "The redirect location of the authentication service is not provided") 
                     # Make the second request 
-                    login_response = requests.get(location, headers=self.HEADERS, verify=False, cookies=cookiejar, 
+                    login_response = session.get(location, headers=self.HEADERS, verify=False, cookies=cookiejar, 
                                                         allow_redirects=False, timeout=common.TIMEOUT_SEC) 
                     if(not login_response.status_code == requests.codes['unauthorized']): 
                         raise SOSError(SOSError.HTTP_ERR, "The authentication service failed to reply with 401")
      
                     # Now provide the credentials 
-                    login_response = requests.get(location, headers=self.HEADERS, auth=(username,password), verify=False, 
+                    login_response = session.get(location, headers=self.HEADERS, auth=(username,password), verify=False, 
                                                cookies=cookiejar, allow_redirects=False, timeout=common.TIMEOUT_SEC) 
                     if(not login_response.status_code == SEC_REDIRECT): 
                         raise SOSError(SOSError.HTTP_ERR, "Access forbidden: Authentication required") 
@@ -103,15 +123,15 @@ class Authentication(object):
                     # Make the final call to get the page with the token 
                     newHeaders = self.HEADERS 
                     newHeaders[SEC_AUTHTOKEN_HEADER] = authToken 
-                    login_response = requests.get(location, headers=newHeaders, verify=False, cookies=cookiejar, 
+                    login_response = session.get(location, headers=newHeaders, verify=False, cookies=cookiejar, 
                                               allow_redirects=False, timeout=common.TIMEOUT_SEC) 
                     if(login_response.status_code != requests.codes['ok']): 
                         raise SOSError(SOSError.HTTP_ERR, "Login failure code: " + str(login_response.status_code) + " Error: " + login_response.text)
             elif(self.__port == LB_API_PORT):
-                login_response = requests.get(url, headers=self.HEADERS, verify=False, cookies=cookiejar, allow_redirects=False)
+                login_response = session.get(url, headers=self.HEADERS, verify=False, cookies=cookiejar, allow_redirects=False)
                 if(login_response.status_code == requests.codes['unauthorized']):
                     # Now provide the credentials
-                    login_response = requests.get(url, headers=self.HEADERS, auth=(username,password), verify=False, cookies=cookiejar, allow_redirects=False)
+                    login_response = session.get(url, headers=self.HEADERS, auth=(username,password), verify=False, cookies=cookiejar, allow_redirects=False)
                 authToken = login_response.headers[SEC_AUTHTOKEN_HEADER] 
             else:
                 raise SOSError(SOSError.HTTP_ERR, "Incorrect port number.  Load balanced port is: " +
@@ -149,7 +169,15 @@ class Authentication(object):
         except (SSLError, socket.error, ConnectionError, Timeout) as e:
             raise SOSError(SOSError.HTTP_ERR, str(e))
 
-        
+        return authToken
+
+    def save_token(self, username, authToken, cookiedir, cookiefile):
+        '''
+        Saves the auth token in the cookiefile, and the path of the
+        cookiefile in the cookie pointer file of the CLI install directory
+        Returns:
+            SUCCESS OR FAILURE
+        '''
         form_cookiefile= None
         parentshellpid = None
         installdir_cookie = None
@@ -238,6 +266,7 @@ class Authentication(object):
 	    (s, h) = common.service_json_request(self.__ipAddr, self.__port, "GET",
                                              Authentication.URI_LOGOUT,
                                              None)
+            common.TOKENS.remove(self.__ipAddr, self.__port)
 	    return s
 
     	except SOSError as e:
@@ -541,6 +570,95 @@ class Authentication(object):
 
 
 
+class AuthManager(object):
+    '''
+    Keeps the auth token of one user on one ViPR instance. Managers are
+    shared per (ipAddr, port, username), so that the drivers of several
+    backends do not overwrite each other's token. A single login is made
+    for concurrent callers, and the token is renewed before it expires.
+    '''
+    TOKEN_LIFETIME_SEC = 8 * 3600 # 8 HOURS, THE VIPR DEFAULT
+    TOKEN_REFRESH_SEC = 30 * 60 # RENEWED 30 MINUTES BEFORE EXPIRY
+
+    __managers = {}
+    __managers_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, ipAddr, port, username, password, cookiedir=None):
+        key = (ipAddr, str(port), username)
+        with cls.__managers_lock:
+            manager = cls.__managers.get(key)
+            if (manager is None):
+                manager = AuthManager(ipAddr, port, username, password, cookiedir)
+                cls.__managers[key] = manager
+            manager.__password = password
+            return manager
+
+    def __init__(self, ipAddr, port, username, password, cookiedir=None):
+        self.__ipAddr = ipAddr
+        self.__port = port
+        self.__username = username
+        self.__password = password
+        self.__cookiedir = cookiedir
+        self.__token = None
+        self.__login_time = 0
+        self.__lock = threading.Lock()
+        # token last returned to each thread, to tell whether a token
+        # rejected by ViPR has already been replaced
+        self.__used = threading.local()
+
+    def use(self):
+        '''
+        Makes the following requests of the calling thread to the ViPR
+        instance use the token of this manager
+        '''
+        common.use_auth_manager(self.__ipAddr, self.__port, self)
+
+    def token(self):
+        '''
+        Returns the auth token, logging in if there is none yet
+        '''
+        token = self.__token
+        if (token is None):
+            with self.__lock:
+                if (self.__token is None):
+                    self.__login()
+                token = self.__token
+        elif (time.time() - self.__login_time >
+              self.TOKEN_LIFETIME_SEC - self.TOKEN_REFRESH_SEC):
+            # only one caller renews the token, the others keep using
+            # the current one meanwhile
+            if (self.__lock.acquire(False)):
+                try:
+                    if (self.__token == token):
+                        self.__login()
+                    token = self.__token
+                except SOSError:
+                    # still valid, the next caller will try again
+                    pass
+                finally:
+                    self.__lock.release()
+        self.__used.token = token
+        return token
+
+    def renew(self):
+        '''
+        Replaces the token that ViPR rejected for the calling thread. When
+        several threads find the token expired, only the first one logs in.
+        '''
+        stale = getattr(self.__used, 'token', None)
+        with self.__lock:
+            if (self.__token is None or self.__token == stale):
+                self.__login()
+
+    def __login(self):
+        obj = Authentication(self.__ipAddr, self.__port)
+        token = obj.login(self.__username, self.__password)
+        if (self.__cookiedir is not None):
+            obj.save_token(self.__username, token, self.__cookiedir, None)
+        self.__token = token
+        self.__login_time = time.time()
+
 
 def add_authentication_provider(args):
     obj = Authentication(args.ip, args.port)
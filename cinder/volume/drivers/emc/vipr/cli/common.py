@@ -32,6 +32,11 @@ from requests.exceptions import SSLError
 from requests.exceptions import ConnectionError
 from requests.exceptions import TooManyRedirects
 from requests.exceptions import Timeout
+try:
+    from requests.adapters import HTTPAdapter
+except ImportError:
+    # requests 0.x, the pool is sized through the session config instead
+    HTTPAdapter = None
 import cookielib
 import xml.dom.minidom
 import getpass
@@ -39,6 +44,12 @@ from xml.etree import ElementTree
 import ConfigParser
 import hashlib
 import hmac
+import threading
+import time
+from contextlib import contextmanager
+from collections import OrderedDict
+import urllib
+import random
 
 
 
@@ -46,14 +57,33 @@ PROD_NAME = 'storageos'
 TENANT_PROVIDER = 'urn:vipr:TenantOrg:provider:'
 
 SWIFT_AUTH_TOKEN = 'X-Auth-Token'
-SESSION = None
+
+# cookie file of the auth token, when not found through VIPR_CLI_INSTALL_DIR
+COOKIE = None
+
+# keep-alive sessions per (ip address, port) of a ViPR instance
+SESSIONS = {}
+SESSIONS_LOCK = threading.Lock()
+POOL_SIZE = 10 # CONNECTIONS KEPT ALIVE PER VIPR INSTANCE, BY DEFAULT
+POOL_SIZES = {} # configured pool size per (ip address, port)
 
 TIMEOUT_SEC = 20 # 20 SECONDS
+CACHE_TTL_SEC = 300 # 5 MINUTES
+CATALOG_TTL_SEC = 3600 # 1 HOUR, FOR TENANTS, PROJECTS, VARRAYS AND VPOOLS
+VOLUME_TYPE_TTL_SEC = 60 # 1 MINUTE, FOR CINDER VOLUME TYPE EXTRA SPECS
+BULK_CHUNK_SIZE = 500 # IDS PER /bulk REQUEST
+TASK_POLL_MIN_SEC = 0.25 # FIRST TASK POLL INTERVAL
+TASK_POLL_MAX_SEC = 10 # TASK POLL INTERVAL CAP
+TASK_POLL_BACKOFF = 1.5 # TASK POLL INTERVAL GROWTH
 OBJCTRL_INSECURE_PORT           = '9010'
 OBJCTRL_PORT                    = '4443'
 
 BOURNE_DEBUG = '0'
 
+# (ipAddr, port, uri template) of the optional REST APIs, such as the
+# ?project=&name= searches, that a ViPR instance has rejected
+UNSUPPORTED_APIS = set()
+
 def _decode_list(data):
     rv = []
     for item in data:
@@ -118,6 +148,59 @@ def xml_decode(rsp):
 
 
 
+def read_cookie_file():
+    '''
+    Returns the auth token saved by a previous authenticate command, found
+    through COOKIE or the cookie pointer file of the CLI install directory
+    '''
+    cookiefile = COOKIE
+    form_cookiefile = None
+    if (cookiefile is None):
+        install_dir = getenv('VIPR_CLI_INSTALL_DIR')
+        if (install_dir is None):
+            raise SOSError(SOSError.NOT_FOUND_ERR,
+                "VIPR_CLI_INSTALL_DIR is not set. Please execute viprcli.profile\n")
+        if sys.platform.startswith('linux'):
+            parentshellpid = os.getpid()
+            if (parentshellpid is not None):
+                form_cookiefile = install_dir + '/cookie/' + str(parentshellpid)
+            else:
+                form_cookiefile = install_dir + '/cookie/cookiefile'
+        elif sys.platform.startswith('win'):
+            form_cookiefile = install_dir + '\\cookie\\cookiefile'
+        else:
+            form_cookiefile = install_dir + '/cookie/cookiefile'
+    if (form_cookiefile):
+        cookiefile = form_cookiefile
+        if (not os.path.exists(cookiefile)):
+            raise SOSError(SOSError.NOT_FOUND_ERR,
+                cookiefile + " : Cookie not found : Please authenticate again")
+        fd = open(cookiefile, 'r')
+        if (fd):
+            fd_content = fd.readline().rstrip()
+            if(fd_content):
+                cookiefile = fd_content
+            else:
+                raise SOSError(SOSError.NOT_FOUND_ERR,
+                    cookiefile + " : Failed to retrive the cookie file")
+        else:
+            raise SOSError(SOSError.NOT_FOUND_ERR, cookiefile + " : read failure\n") 
+
+    if (cookiefile):
+        if (not os.path.exists(cookiefile)):
+            raise SOSError(SOSError.NOT_FOUND_ERR,
+                cookiefile + " : Cookie not found : Please authenticate again")
+        if (not os.path.isfile(cookiefile)):
+            raise SOSError(SOSError.NOT_FOUND_ERR,
+               cookiefile + " : Not a cookie file")
+        #cookiejar.load(cookiefile, ignore_discard=True, ignore_expires=True)
+        tokenfile = open(cookiefile)
+        token = tokenfile.read()
+        tokenfile.close()
+        return token
+    else:
+        raise SOSError(SOSError.NOT_FOUND_ERR, cookiefile + " : Cookie file not found")
+
 def service_json_request(ip_addr, port, http_method, uri, body, token=None, 
                          xml=False, contenttype='application/json', filename=None, 
                          customheaders=None, apitype=None):
@@ -135,9 +218,6 @@ def service_json_request(ip_addr, port, http_method, uri, body, token=None,
         a tuple of two elements: (response body, response headers)
     Throws: SOSError in case of HTTP errors with err_code 3
     '''
-    global COOKIE
-    global SESSION
-
     SEC_AUTHTOKEN_HEADER   = 'X-SDS-AUTH-TOKEN'
 
     if (xml):
@@ -159,67 +239,22 @@ def service_json_request(ip_addr, port, http_method, uri, body, token=None,
 
     try:
 
-        cookiefile = COOKIE
-        form_cookiefile = None
-        if (cookiefile is None):
-            install_dir = getenv('VIPR_CLI_INSTALL_DIR')
-            if (install_dir is None):
-                raise SOSError(SOSError.NOT_FOUND_ERR,
-                    "VIPR_CLI_INSTALL_DIR is not set. Please execute viprcli.profile\n")
-            if sys.platform.startswith('linux'):
-                parentshellpid = os.getpid()
-                if (parentshellpid is not None):
-                    form_cookiefile = install_dir + '/cookie/' + str(parentshellpid)
-                else:
-                    form_cookiefile = install_dir + '/cookie/cookiefile'
-            elif sys.platform.startswith('win'):
-                form_cookiefile = install_dir + '\\cookie\\cookiefile'
-            else:
-                form_cookiefile = install_dir + '/cookie/cookiefile'
-	if (form_cookiefile):
-	    cookiefile = form_cookiefile
-            if (not os.path.exists(cookiefile)):
-                raise SOSError(SOSError.NOT_FOUND_ERR,
-                    cookiefile + " : Cookie not found : Please authenticate again")
-            fd = open(cookiefile, 'r')
-            if (fd):
-                fd_content = fd.readline().rstrip()
-                if(fd_content):
-                    cookiefile = fd_content
-                else:
-                    raise SOSError(SOSError.NOT_FOUND_ERR,
-                        cookiefile + " : Failed to retrive the cookie file")
-            else:
-                raise SOSError(SOSError.NOT_FOUND_ERR, cookiefile + " : read failure\n") 
-
         url = "https://" + ip_addr + ":" + str(port) + uri
 
         cookiejar = cookielib.LWPCookieJar()    
-        if (cookiefile):
-            if (not os.path.exists(cookiefile)):
-                raise SOSError(SOSError.NOT_FOUND_ERR,
-                    cookiefile + " : Cookie not found : Please authenticate again")
-            if (not os.path.isfile(cookiefile)):
-                raise SOSError(SOSError.NOT_FOUND_ERR,
-                   cookiefile + " : Not a cookie file")
-            #cookiejar.load(cookiefile, ignore_discard=True, ignore_expires=True)
-            tokenfile = open(cookiefile)
-            token = tokenfile.read()
-            tokenfile.close()
-        else:
-            raise SOSError(SOSError.NOT_FOUND_ERR, cookiefile + " : Cookie file not found")
-            
+        token = get_auth_token(ip_addr, port)
+
         headers[SEC_AUTHTOKEN_HEADER] = token
-        SESSION = SESSION or requests.Session()
+        session = get_session(ip_addr, port)
         if (http_method == 'GET'):
 	    '''when the GET request is specified with a filename, we write the contents of the GET
 	       request to the filename. This option generally is used when the contents to be returned
 	       are large. So, rather than getting all the data at once we Use prefetch=False for the purpose
 	       of streaming. Prefetch = False means we can stream data'''
 	    if(filename):
-                response = SESSION.get(url, prefetch=False, headers=headers, verify=False, cookies=cookiejar)
+                response = session.get(url, prefetch=False, headers=headers, verify=False, cookies=cookiejar)
 	    else:
-                response = SESSION.get(url, headers=headers, verify=False, cookies=cookiejar)
+                response = session.get(url, headers=headers, verify=False, cookies=cookiejar)
             
 	    if(filename):
                 try:
@@ -236,13 +271,13 @@ def service_json_request(ip_addr, port, http_method, uri, body, token=None,
         elif (http_method == 'POST'):
             if(filename):
                 with open(filename) as f:
-                    response = requests.post(url, data=f, headers=headers, verify=False, cookies=cookiejar)
+                    response = session.post(url, data=f, headers=headers, verify=False, cookies=cookiejar)
             else:
-                response = requests.post(url, data=body, headers=headers, verify=False, cookies=cookiejar)
+                response = session.post(url, data=body, headers=headers, verify=False, cookies=cookiejar)
         elif (http_method == 'PUT'):
-            response = SESSION.put(url, data=body, headers=headers, verify=False, cookies=cookiejar)
+            response = session.put(url, data=body, headers=headers, verify=False, cookies=cookiejar)
         elif (http_method == 'DELETE'):
-            response = SESSION.delete(url, headers=headers, verify=False, cookies=cookiejar)
+            response = session.delete(url, headers=headers, verify=False, cookies=cookiejar)
         else:
             raise SOSError(SOSError.HTTP_ERR, "Unknown/Unsupported HTTP method: " + http_method)
     
@@ -281,6 +316,46 @@ def service_json_request(ip_addr, port, http_method, uri, body, token=None,
     except IOError as e:
         raise SOSError(SOSError.HTTP_ERR, str(e))
     
+def get_session(ip_addr, port):
+    '''
+    Returns the HTTP session used for the requests to a ViPR instance.
+    The session pools up to the configured number of keep-alive
+    connections of the instance, POOL_SIZE by default, so that the
+    TCP connection and TLS session are reused by the following requests
+    of any method instead of being set up for each request.
+    '''
+    key = (ip_addr, str(port))
+    session = SESSIONS.get(key)
+    if (session is None):
+        with SESSIONS_LOCK:
+            session = SESSIONS.get(key)
+            if (session is None):
+                pool_size = POOL_SIZES.get(key, POOL_SIZE)
+                if (HTTPAdapter):
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1,
+                                          pool_maxsize=pool_size)
+                    session.mount('https://', adapter)
+                else:
+                    session = requests.session(
+                        config={'pool_connections': 1,
+                                'pool_maxsize': pool_size,
+                                'keep_alive': True})
+                SESSIONS[key] = session
+    return session
+
+def configure_connection_pool(ip_addr, port, pool_size):
+    '''
+    Sets the number of connections kept alive to a ViPR instance. If the
+    size changes, the session of the instance is discarded, so that the
+    new size is used; the sessions of other instances are kept.
+    '''
+    key = (ip_addr, str(port))
+    with SESSIONS_LOCK:
+        if (POOL_SIZES.get(key) != pool_size):
+            POOL_SIZES[key] = pool_size
+            SESSIONS.pop(key, None)
+
 def is_uri(name):
     '''
     Checks whether the name is a UUID or not
@@ -474,22 +549,79 @@ def list_by_hrefs(ipAddr, port,  hrefs):
     Extract the href and get the object details and append to list
     then return the list contain object details
     '''
-    output = []
+    # group the ids by resource type, so each type is fetched in bulk
+    groups = {}
     for link in hrefs:
         href = link['link']
-        hrefuri = href['href']
-        #we need keep except to over exception from appliance, later we can take off
-        try:
-            (s, h) = service_json_request(ipAddr, port,
-                                             "GET",
-                                             hrefuri, None, None)
-            o = json_decode(s)
-            if(o['inactive'] == False):
-                output.append(o)
-        except:
-            pass
+        (parent, id) = href['href'].rsplit('/', 1)
+        groups.setdefault(parent, []).append(id)
+
+    details = {}
+    for (parent, ids) in groups.items():
+        # bulk_get falls back to fetching the objects one by one itself
+        for o in bulk_get(ipAddr, port, parent + '/bulk', ids):
+            details[o['id']] = o
+
+    output = []
+    for link in hrefs:
+        id = link['link']['href'].rsplit('/', 1)[1]
+        if(id in details):
+            output.append(details[id])
     return output
 
+def bulk_get(ipAddr, port, bulkUri, ids, show_inactive=False, ids_stable=False):
+    '''
+    Returns the details of the resources with the given ids, in the order
+    of the ids. bulkUri is the bulk resource of the resource type, for
+    example /block/volumes/bulk; the ids are posted to it in chunks of
+    BULK_CHUNK_SIZE. Resources that are inactive or do not exist anymore
+    are left out. If the ViPR instance has no bulk API for the type, the
+    resources are fetched one by one. A 404 or 405 for the bulk resource
+    marks the bulk API as unsupported; so does a 400 if ids_stable tells
+    that the ids cannot have been deleted.
+    '''
+    ids = list(ids)
+    objs = None
+    if(is_api_supported(ipAddr, port, bulkUri)):
+        try:
+            objs = []
+            for i in range(0, len(ids), BULK_CHUNK_SIZE):
+                body = json.dumps({'id' : ids[i:i + BULK_CHUNK_SIZE]})
+                (s, h) = service_json_request(ipAddr, port, "POST",
+                                              bulkUri, body)
+                o = json_decode(s)
+                # the details are under a key named after the type,
+                # for example 'volume' or 'storage_port'
+                for value in o.values():
+                    if(isinstance(value, list)):
+                        objs.extend(value)
+        except SOSError as e:
+            if(not is_unsupported_api_error(e)):
+                raise e
+            if(ids_stable or e.err_text.find("HTTP code: 400") == -1):
+                set_api_unsupported(ipAddr, port, bulkUri)
+            # a 400 may also mean that one of the ids was deleted
+            objs = None
+
+    if(objs is None):
+        objs = []
+        uri = bulkUri.rsplit('/', 1)[0] + '/{0}'
+        for id in ids:
+            try:
+                (s, h) = service_json_request(ipAddr, port, "GET",
+                                              uri.format(id), None)
+            except SOSError as e:
+                if(e.err_text.find("HTTP code: 404") != -1):
+                    continue
+                raise e
+            objs.append(json_decode(s))
+
+    details = {}
+    for o in objs:
+        if(show_inactive or not o.get('inactive')):
+            details[o['id']] = o
+    return [details[id] for id in ids if id in details]
+
 def show_by_href( ipAddr, port, href):
     '''
     This function will get the href of object and display the details of the same
@@ -722,18 +854,77 @@ def search_by_project_and_name(projectName, componentName, searchUri, ipAddr, po
             proj_obj = Project(ipAddr, port)
             project_uri  = proj_obj.project_query(projectName)
         
-            (s, h) = service_json_request(ipAddr, port, "GET", searchUri.format(project_uri, componentName), None)
-        
-            o = json_decode(s)
-            if not o:
-                return None
-        
-            resources = get_node_value(o, "resource")
-            if(len(resources)>0):
-                component_uri = resources[0]['id']
-                return component_uri    
+            uris = search_by_name(searchUri.format(project_uri, '{0}'), componentName, ipAddr, port)
+            if(len(uris)>0):
+                return uris[0]
+            return None
         else:
             raise SOSError(SOSError.VALUE_ERR, "Search URI "+strUri+" is not in the expected format, it should end with ?project={0}&name={1}")
+
+def search_by_name(searchUri, name, ipAddr, port):
+    '''
+    Runs a ViPR search whose uri template takes the name as {0} and returns
+    the uris of the resources whose name is exactly the given name; the
+    search itself also returns partial matches.
+    '''
+    if(isinstance(name, unicode)):
+        quoted = urllib.quote(name.encode('utf-8'), '')
+    else:
+        quoted = urllib.quote(name, '')
+    (s, h) = service_json_request(ipAddr, port, "GET",
+                                  searchUri.format(quoted), None)
+    o = json_decode(s)
+    if not o:
+        return []
+
+    uris = []
+    for resource in get_node_value(o, "resource"):
+        if(resource.get('match', name) == name):
+            uris.append(resource['id'])
+    return uris
+
+def query_by_project_and_name(projectUri, componentName, searchUri, ipAddr, port, scanfunc):
+    '''
+    Resolves the uri of a component of a project from its name. The
+    server side ?project={0}&name={1} search is used when the ViPR instance
+    supports it; otherwise scanfunc(projectUri, componentName) is called,
+    which is expected to list the project and compare names.
+    Returns the uri of the component, or None if it does not exist.
+    '''
+    if(is_api_supported(ipAddr, port, searchUri)):
+        try:
+            return search_by_project_and_name(projectUri, componentName, searchUri, ipAddr, port)
+        except SOSError as e:
+            if(not is_unsupported_api_error(e)):
+                raise e
+            set_api_unsupported(ipAddr, port, searchUri)
+    return scanfunc(projectUri, componentName)
+
+def is_api_supported(ipAddr, port, uri):
+    return (ipAddr, port, uri) not in UNSUPPORTED_APIS
+
+def set_api_unsupported(ipAddr, port, uri):
+    UNSUPPORTED_APIS.add((ipAddr, port, uri))
+
+def is_unsupported_api_error(e):
+    '''
+    Returns True if the SOSError reports that the ViPR instance does not
+    implement the requested API (HTTP 400, 404 or 405)
+    '''
+    if(e.err_code != SOSError.HTTP_ERR):
+        return False
+    for code in ['400', '404', '405']:
+        if(e.err_text.find("HTTP code: " + code) != -1):
+            return True
+    return False
+
+def is_not_found_error(e):
+    '''
+    Returns True if the SOSError reports that the resource is not found
+    (HTTP 404)
+    '''
+    return (e.err_code == SOSError.HTTP_ERR and
+            e.err_text.find("HTTP code: 404") != -1)
         
 
 class SOSError(Exception):
@@ -758,6 +949,411 @@ class SOSError(Exception):
         return repr(self.err_text)
 
 
+def poll_until(check, timeout):
+    '''
+    Calls check() until it returns a true value or timeout seconds have
+    passed. The first retries follow quickly, then the interval grows
+    like the task polls of the TaskWatcher.
+    Returns:
+        the last value returned by check()
+    '''
+    deadline = time.time() + timeout
+    interval = TASK_POLL_MIN_SEC
+    while(True):
+        result = check()
+        now = time.time()
+        if(result or now >= deadline):
+            return result
+        time.sleep(min(random.uniform(interval / 2, interval), deadline - now))
+        interval = min(interval * TASK_POLL_BACKOFF, TASK_POLL_MAX_SEC)
+
+
+class Batcher(object):
+    '''
+    Coalesces the items submitted for the same key within a short window
+    into one call of flush(key, items). The first caller of a window waits
+    for the window to pass and then calls flush, with its own auth token;
+    every caller gets the result of flush, or its error.
+    '''
+    def __init__(self, flush, window):
+        self.__flush = flush
+        self.__window = window
+        self.__batches = {}
+        self.__lock = threading.Lock()
+
+    def submit(self, key, item):
+        with self.__lock:
+            batch = self.__batches.get(key)
+            leader = batch is None
+            if(leader):
+                batch = {'items': [], 'future': TaskFuture()}
+                self.__batches[key] = batch
+            batch['items'].append(item)
+
+        if(leader):
+            time.sleep(self.__window)
+            with self.__lock:
+                del self.__batches[key]
+            try:
+                batch['future']._set(self.__flush(key, batch['items']))
+            except Exception as e:
+                batch['future']._set(None, e)
+        return batch['future'].result()
+
+
+class KeyedLock(object):
+    '''
+    One lock per key: "with keyed_lock.hold(key):" serializes the callers
+    holding the same key, while those holding different keys run in
+    parallel. The lock of a key is dropped once nobody holds or waits for it.
+    '''
+    def __init__(self):
+        self.__locks = {}
+        self.__lock = threading.Lock()
+
+    @contextmanager
+    def hold(self, key):
+        with self.__lock:
+            entry = self.__locks.get(key)
+            if(entry is None):
+                entry = [threading.Lock(), 0]
+                self.__locks[key] = entry
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self.__lock:
+                entry[1] -= 1
+                if(entry[1] == 0):
+                    del self.__locks[key]
+
+
+class TTLCache(object):
+    '''
+    Thread safe key/value cache whose entries expire ttl seconds after
+    they were stored. Used to remember name to URI resolutions so that
+    repeated lookups do not have to go back to the ViPR instance.
+    When maxsize is given, storing a new entry in a full cache evicts the
+    least recently used one.
+    '''
+    def __init__(self, ttl=CACHE_TTL_SEC, maxsize=None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        '''
+        Returns the value stored for key, or default if the key is
+        unknown or its entry has expired
+        '''
+        with self._lock:
+            entry = self._entries.get(key)
+            if (entry is None):
+                return default
+            (value, expires) = entry
+            if (expires < time.time()):
+                del self._entries[key]
+                return default
+            if (self.maxsize is not None):
+                # move the entry to the most recently used end
+                del self._entries[key]
+                self._entries[key] = entry
+            return value
+
+    def __contains__(self, key):
+        marker = object()
+        return self.get(key, marker) is not marker
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            if (self.maxsize is not None and len(self._entries) >= self.maxsize):
+                self._entries.popitem(last=False)
+            self._entries[key] = (value, time.time() + self.ttl)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_matching(self, predicate):
+        '''
+        Drops every entry whose key satisfies predicate(key)
+        '''
+        with self._lock:
+            for key in [k for k in self._entries if predicate(k)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class TaskFuture(object):
+    '''
+    Result of a task registered with a TaskWatcher
+    '''
+    def __init__(self):
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._task = None
+        self._error = None
+        self._callbacks = []
+
+    def done(self):
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        '''
+        Waits for the task to complete
+        Returns:
+            the task, in the ready or error state, or None if the task
+            timed out or the future was cancelled
+        Throws:
+            SOSError - when the task could not be queried
+        '''
+        self._done.wait(timeout)
+        if(self._error):
+            raise self._error
+        return self._task
+
+    def cancel(self):
+        self._set(None)
+
+    def add_done_callback(self, fn):
+        '''
+        Calls fn(future) once the future is done, right away if it already
+        is. The callbacks run in the thread that completes the future,
+        usually the TaskWatcher scheduler, so they should be short.
+        '''
+        with self._lock:
+            if(not self._done.is_set()):
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+    def _set(self, task, error=None):
+        with self._lock:
+            if(self._done.is_set()):
+                return
+            self._task = task
+            self._error = error
+            self._done.set()
+            callbacks = self._callbacks
+            self._callbacks = []
+        for fn in callbacks:
+            try:
+                fn(self)
+            except Exception:
+                # a failing callback must not stop the scheduler
+                pass
+
+
+class TaskWatcher(object):
+    '''
+    Polls the pending tasks of a ViPR instance from a single scheduler
+    thread. Each task is polled quickly at first, then the interval grows
+    exponentially up to TASK_POLL_MAX_SEC, with jitter. The tasks due in
+    the same tick whose ids are known are queried with one bulk request,
+    so the cost grows with the tick rate rather than the number of
+    pending tasks.
+    '''
+    URI_TASKS_BULK = '/vdc/tasks/bulk'
+
+    __watchers = {}
+    __watchers_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, ip_addr, port):
+        key = (ip_addr, str(port))
+        with cls.__watchers_lock:
+            watcher = cls.__watchers.get(key)
+            if(watcher is None):
+                watcher = TaskWatcher(ip_addr, port)
+                cls.__watchers[key] = watcher
+            return watcher
+
+    def __init__(self, ip_addr, port):
+        self.__ip_addr = ip_addr
+        self.__port = port
+        self.__entries = []
+        self.__cond = threading.Condition()
+        self.__thread = None
+
+    def watch(self, poll, timeout):
+        '''
+        Registers a task. poll() returns the task, as the task APIs of the
+        resource do; the requests are made with the auth token of the
+        calling thread.
+        Returns:
+            a TaskFuture, which completes with None after timeout seconds
+        '''
+        now = time.time()
+        entry = {'poll': poll,
+                 'id': None,
+                 'auth': dict(getattr(AUTH_SCOPE, 'managers', {})),
+                 'future': TaskFuture(),
+                 'due': now,
+                 'interval': TASK_POLL_MIN_SEC,
+                 'deadline': None}
+        if(timeout is not None):
+            entry['deadline'] = now + timeout
+        with self.__cond:
+            self.__entries.append(entry)
+            if(self.__thread is None):
+                self.__thread = threading.Thread(target=self.__run)
+                self.__thread.daemon = True
+                self.__thread.start()
+            self.__cond.notify()
+        return entry['future']
+
+    def __run(self):
+        try:
+            while(True):
+                with self.__cond:
+                    while(True):
+                        self.__entries = [entry for entry in self.__entries
+                                          if not entry['future'].done()]
+                        if(not self.__entries):
+                            self.__thread = None
+                            return
+                        now = time.time()
+                        wait = min([entry['due'] for entry in self.__entries]) - now
+                        if(wait <= 0):
+                            break
+                        self.__cond.wait(wait)
+                    # also poll the tasks due shortly, to batch more of them
+                    due = [entry for entry in self.__entries
+                           if entry['due'] <= now + TASK_POLL_MIN_SEC]
+                try:
+                    self.__poll(due)
+                except Exception as e:
+                    # fail the tasks of this tick rather than stop polling
+                    for entry in due:
+                        entry['future']._set(None, e)
+        finally:
+            # let the next watch() start a new scheduler, whatever happened
+            with self.__cond:
+                if(self.__thread is threading.current_thread()):
+                    self.__thread = None
+
+    def __poll(self, entries):
+        bulk = {}
+        for entry in entries:
+            if(entry['future'].done()):
+                continue
+            if(entry['id'] and is_api_supported(self.__ip_addr, self.__port,
+                                                self.URI_TASKS_BULK)):
+                # the tasks queried together must share the auth token
+                key = id(entry['auth'].get((self.__ip_addr, str(self.__port))))
+                bulk.setdefault(key, []).append(entry)
+                continue
+            self.__poll_one(entry)
+
+        for group in bulk.values():
+            AUTH_SCOPE.managers = group[0]['auth']
+            try:
+                # task ids are not reused, so a 400 or 404 means that the
+                # bulk API is missing rather than that a task was deleted
+                tasks = bulk_get(self.__ip_addr, self.__port, self.URI_TASKS_BULK,
+                                 [entry['id'] for entry in group], True,
+                                 ids_stable=True)
+            except Exception as e:
+                for entry in group:
+                    entry['future']._set(None, e)
+                continue
+            tasks = dict([(task['id'], task) for task in tasks])
+            for entry in group:
+                if(entry['id'] in tasks):
+                    try:
+                        self.__update(entry, tasks[entry['id']])
+                    except Exception as e:
+                        entry['future']._set(None, e)
+                else:
+                    # not returned by the bulk request, ask the resource
+                    self.__poll_one(entry)
+
+    def __poll_one(self, entry):
+        AUTH_SCOPE.managers = entry['auth']
+        try:
+            task = entry['poll']()
+            if(task and task.get('id')):
+                entry['id'] = task['id']
+            self.__update(entry, task)
+        except Exception as e:
+            entry['future']._set(None, e)
+
+    def __update(self, entry, task):
+        if(task and task["state"] in ["ready", "error"]):
+            entry['future']._set(task)
+            return
+        now = time.time()
+        interval = entry['interval']
+        delay = random.uniform(interval / 2, interval)
+        if(entry['deadline'] is not None):
+            if(now >= entry['deadline']):
+                entry['future']._set(None)
+                return
+            delay = min(delay, entry['deadline'] - now)
+        entry['due'] = now + delay
+        entry['interval'] = min(interval * TASK_POLL_BACKOFF, TASK_POLL_MAX_SEC)
+
+
+class AuthTokenStore(object):
+    '''
+    Keeps the X-SDS-AUTH-TOKEN of each ViPR instance in memory once a user
+    is authenticated, so the requests do not read it from the cookie files
+    '''
+    def __init__(self):
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def get(self, ip_addr, port):
+        with self._lock:
+            return self._tokens.get((ip_addr, str(port)))
+
+    def put(self, ip_addr, port, token):
+        with self._lock:
+            self._tokens[(ip_addr, str(port))] = token
+
+    def remove(self, ip_addr, port):
+        with self._lock:
+            self._tokens.pop((ip_addr, str(port)), None)
+
+TOKENS = AuthTokenStore()
+
+# AuthManager used by the current thread for each (ip address, port)
+AUTH_SCOPE = threading.local()
+
+def use_auth_manager(ip_addr, port, manager):
+    if (not hasattr(AUTH_SCOPE, 'managers')):
+        AUTH_SCOPE.managers = {}
+    AUTH_SCOPE.managers[(ip_addr, str(port))] = manager
+
+def get_auth_token(ip_addr, port):
+    '''
+    Returns the auth token for a request of the current thread: the token
+    of the AuthManager the thread uses for the instance if any, otherwise
+    the token of TOKENS or of the cookie files
+    '''
+    manager = getattr(AUTH_SCOPE, 'managers', {}).get((ip_addr, str(port)))
+    if (manager):
+        return manager.token()
+    token = TOKENS.get(ip_addr, port)
+    if (token is None):
+        token = read_cookie_file()
+    return token
+
+def renew_auth_tokens():
+    '''
+    Replaces the tokens of the AuthManagers used by the current thread,
+    after a request was rejected as not authenticated
+    '''
+    for manager in getattr(AUTH_SCOPE, 'managers', {}).values():
+        manager.renew()
+
+
 from xml.dom.minidom import Document
 import copy
 
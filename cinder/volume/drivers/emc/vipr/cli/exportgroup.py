@@ -18,8 +18,6 @@
 #import python system modules
 
 import common
-from threading import Timer
-import time
 from volume import Volume
 from snapshot import Snapshot
 from common import SOSError
@@ -30,6 +28,7 @@ from host import Host
 from virtualarray import VirtualArray
 import uuid
 import json
+import urllib
 
 class ExportGroup(object):
     '''
@@ -39,11 +38,28 @@ class ExportGroup(object):
     URI_EXPORT_GROUPS_SHOW = URI_EXPORT_GROUP + "/{0}"
     URI_EXPORT_GROUP_LIST = '/projects/{0}/resources'
     URI_EXPORT_GROUP_SEARCH = '/block/exports/search'
+    URI_EXPORT_GROUP_SEARCH_BY_PROJECT_AND_NAME = URI_EXPORT_GROUP_SEARCH + '?project={0}&name={1}'
+    URI_EXPORT_GROUP_SEARCH_BY_TAG = URI_EXPORT_GROUP_SEARCH + '?tag={0}'
+    URI_EXPORT_GROUP_TAGS = URI_EXPORT_GROUPS_SHOW + '/tags'
     URI_EXPORT_GROUP_DEACTIVATE = URI_EXPORT_GROUPS_SHOW +  '/deactivate'
     URI_EXPORT_GROUP_UPDATE = '/block/exports/{0}'
+    URI_EXPORT_GROUP_BULK = URI_EXPORT_GROUP + '/bulk'
     URI_TASK_LIST = URI_EXPORT_GROUPS_SHOW + '/tasks'
     URI_TASK = URI_TASK_LIST + '/{1}'
+
+    timeout = 300
     EXPORTGROUP_TYPE = ['Exclusive', 'Host', 'Cluster']
+
+    # Index of the export groups shared by all ExportGroup objects, keyed by
+    # (ipAddr, port, project uri, name) and by
+    # (ipAddr, port, project uri, frozenset of initiator ports, varray uri)
+    name_cache = common.TTLCache()
+    ports_cache = common.TTLCache()
+    # (ipAddr, port, group uri) -> (project uri, name, ports, varray uri),
+    # or None for an inactive group
+    uri_cache = common.TTLCache()
+    # (ipAddr, port, group uri) -> names given to the group with exportgroup_alias
+    alias_cache = common.TTLCache()
                          
     def __init__(self, ipAddr, port):
         '''
@@ -192,6 +208,7 @@ class ExportGroup(object):
                         "POST", 
                         self.URI_EXPORT_GROUP_DEACTIVATE.format(uri), 
                         None, token)
+        self._unindex_group(uri)
         return
     
 
@@ -207,13 +224,32 @@ class ExportGroup(object):
         if (common.is_uri(name)):
             return name
 
+        if(tenant == None):
+            tenant = ""
+        projobj = Project(self.__ipAddr, self.__port)
+        projuri = projobj.project_query(tenant+"/"+project)
+
+        uri = ExportGroup.name_cache.get((self.__ipAddr, self.__port, projuri, name))
+        if(uri):
+            return uri
+        uri = common.query_by_project_and_name(projuri, name,
+                        self.URI_EXPORT_GROUP_SEARCH_BY_PROJECT_AND_NAME,
+                        self.__ipAddr, self.__port,
+                        lambda projuri, name: self._scan_project(name, project, tenant))
+        if(uri):
+            # index the group, so that the next queries are not sent to ViPR
+            self._fetch_group(uri)
+            return uri
+        raise SOSError(SOSError.NOT_FOUND_ERR, "Export Group " + name + ": not found")
+
+    def _scan_project(self, name, project, tenant):
         uris = self.exportgroup_list(project, tenant)
         for uri in uris:
             exportgroup = self.exportgroup_show(uri, project, tenant)
             if(exportgroup):
                 if (exportgroup['name'] == name ):
-                    return exportgroup['id']    
-        raise SOSError(SOSError.NOT_FOUND_ERR, "Export Group " + name + ": not found")
+                    return exportgroup['id']
+        return None
     
 
         
@@ -236,7 +272,10 @@ class ExportGroup(object):
         #get volume uri
         if(tenantname == None):
             tenantname = "" 
-        fullvolname = tenantname+"/"+projectname+"/"+volumename
+        if(common.is_uri(volumename)):
+            fullvolname = volumename
+        else:
+            fullvolname = tenantname+"/"+projectname+"/"+volumename
         vol_uri =  Volume(self.__ipAddr, self.__port).volume_query(fullvolname)
         
         #if snapshot given then snapshot added to exportgroup
@@ -279,7 +318,10 @@ class ExportGroup(object):
         #get volume uri
         if(tenantname == None):
             tenantname = ""
-        fullvolname = tenantname+"/"+projectname+"/"+volumename
+        if(common.is_uri(volumename)):
+            fullvolname = volumename
+        else:
+            fullvolname = tenantname+"/"+projectname+"/"+volumename
         vol_uri =  Volume(self.__ipAddr, self.__port).volume_query(fullvolname)
                   
          #if snapshot given then snapshot added to exportgroup
@@ -306,7 +348,22 @@ class ExportGroup(object):
         return o
     
     
+    def exportgroup_add_volumes_by_uri(self, exportgroup_uri, vol_uris, sync=False):
+        '''
+        Adds volumes to an export group with a single update
+        parameters:
+           exportgroup_uri : uri of the export group
+           vol_uris        : uris of the volumes
+        '''
+        parms = {}
+        parms['volume_changes'] = {'add': [{'id': vol_uri} for vol_uri in vol_uris]}
+        return self._change_volumes(exportgroup_uri, parms, sync)
+
     def exportgroup_remove_volumes_by_uri(self, exportgroup_uri, vol_uri, sync=False, tenantname=None, projectname=None, snapshot=None, cg=None):
+        '''
+        Removes a volume, or a list of volumes with a single update, from an
+        export group
+        '''
                   
          #if snapshot given then snapshot added to exportgroup
         if(snapshot):
@@ -324,12 +381,28 @@ class ExportGroup(object):
 
         parms = {}
 
-        parms['volume_changes'] = self._remove_list(vol_uri)
+        if(isinstance(vol_uri, list)):
+            parms['volume_changes'] = {'remove': vol_uri}
+        else:
+            parms['volume_changes'] = self._remove_list(vol_uri)
         
-        o = self.send_json_request(exportgroup_uri, parms)
-        if(sync):
-            return self.block_until_complete(exportgroup_uri, o["op_id"])
-        return o
+        return self._change_volumes(exportgroup_uri, parms, sync)
+
+    def _change_volumes(self, exportgroup_uri, parms, sync):
+        '''
+        Sends the volume changes of the export group. If ViPR does not find
+        the group, it is dropped from the index, so that the next lookups
+        do not return it.
+        '''
+        try:
+            o = self.send_json_request(exportgroup_uri, parms)
+            if(sync):
+                return self.block_until_complete(exportgroup_uri, o["op_id"])
+            return o
+        except SOSError as e:
+            if(common.is_not_found_error(e)):
+                self._unindex_group(exportgroup_uri)
+            raise e
     
     # initator
         '''
@@ -434,28 +507,184 @@ class ExportGroup(object):
         body = json.dumps(param)
         (s, h) = common.service_json_request(self.__ipAddr, self.__port,
                             "PUT", self.URI_EXPORT_GROUP_UPDATE.format(exportgroup_uri), body)
+        # the initiators of the group change unless only volumes are changed
+        if(set(param.keys()) - set(['volume_changes'])):
+            self._unindex_group(exportgroup_uri)
         return common.json_decode(s)
 
+    def exportgroup_find(self, initiator_ports, varray, project, tenant):
+        '''
+        Returns the uri of the export group of the project whose initiators
+        are exactly the given initiator ports, in the given varray, or None.
+        The project index is refreshed on a miss.
+        parameters:
+           initiator_ports : initiator ports (WWNs or IQNs)
+           varray          : name/id of the varray
+        '''
+        if(tenant == None):
+            tenant = ""
+        projuri = Project(self.__ipAddr, self.__port).project_query(tenant+"/"+project)
+        varray_uri = VirtualArray(self.__ipAddr, self.__port).varray_query(varray)
+        key = (self.__ipAddr, self.__port, projuri, frozenset(initiator_ports), varray_uri)
+        uri = ExportGroup.ports_cache.get(key)
+        if(uri is None):
+            self._index_project(projuri)
+            uri = ExportGroup.ports_cache.get(key)
+        return uri
+
+    def _index_project(self, projuri):
+        '''
+        Adds the export groups of a project to the index. Groups that are
+        already indexed are not fetched again, so a refresh costs one search
+        plus a bulk request for the groups created or changed since.
+        '''
+        (s, h) = common.service_json_request(self.__ipAddr, self.__port, "GET",
+                            self.URI_EXPORT_GROUP_SEARCH + '?project=' + projuri, None)
+        o = common.json_decode(s)
+        uris = []
+        if(o):
+            for resource in common.get_node_value(o, "resource"):
+                if((self.__ipAddr, self.__port, resource["id"]) not in ExportGroup.uri_cache):
+                    uris.append(resource["id"])
+
+        groups = common.bulk_get(self.__ipAddr, self.__port,
+                                 self.URI_EXPORT_GROUP_BULK, uris)
+        for uri in uris:
+            # inactive groups are remembered so that they are not fetched
+            # again; the active ones are indexed below
+            ExportGroup.uri_cache.put((self.__ipAddr, self.__port, uri), None)
+        for group in groups:
+            self._index_group(projuri, group)
+
+    def _index_group(self, projuri, group):
+        ports = frozenset([initiator['initiator_port']
+                           for initiator in (group.get('initiators') or [])])
+        varray_uri = None
+        if(group.get('varray')):
+            varray_uri = group['varray']['id']
+        # keep the first group found when names or initiators are duplicated
+        key = (self.__ipAddr, self.__port, projuri, group['name'])
+        if(key not in ExportGroup.name_cache):
+            ExportGroup.name_cache.put(key, group['id'])
+        key = (self.__ipAddr, self.__port, projuri, ports, varray_uri)
+        if(key not in ExportGroup.ports_cache):
+            ExportGroup.ports_cache.put(key, group['id'])
+        ExportGroup.uri_cache.put((self.__ipAddr, self.__port, group['id']),
+                                  (projuri, group['name'], ports, varray_uri))
+
+    def exportgroup_initiator_ports(self, exportgroup_uri):
+        '''
+        Returns the initiator ports of the export group, from the index,
+        or None if the group is inactive
+        '''
+        entry = ExportGroup.uri_cache.get((self.__ipAddr, self.__port, exportgroup_uri))
+        if(entry is None):
+            entry = self._fetch_group(exportgroup_uri)
+        if(entry is None):
+            return None
+        return entry[2]
+
+    def _fetch_group(self, uri):
+        '''
+        Adds the export group to the index and returns its index entry,
+        or None if the group is inactive
+        '''
+        (s, h) = common.service_json_request(self.__ipAddr, self.__port, "GET",
+                                             self.URI_EXPORT_GROUPS_SHOW.format(uri), None)
+        group = common.json_decode(s)
+        if(group.get('inactive')):
+            ExportGroup.uri_cache.put((self.__ipAddr, self.__port, uri), None)
+            return None
+        self._index_group(group['project']['id'], group)
+        return ExportGroup.uri_cache.get((self.__ipAddr, self.__port, uri))
+
+    def exportgroup_alias(self, name, uri, project, tenant):
+        '''
+        Makes exportgroup_query resolve name to the export group uri, as long
+        as the group stays in the index. The group is not renamed in ViPR.
+        parameters:
+           name : the other name of the export group.
+           uri  : uri of the export group.
+        '''
+        if(tenant == None):
+            tenant = ""
+        projuri = Project(self.__ipAddr, self.__port).project_query(tenant+"/"+project)
+        ExportGroup.name_cache.put((self.__ipAddr, self.__port, projuri, name), uri)
+        aliases = ExportGroup.alias_cache.get((self.__ipAddr, self.__port, uri)) or []
+        ExportGroup.alias_cache.put((self.__ipAddr, self.__port, uri),
+                                    aliases + [(projuri, name)])
 
-    # Blocks the opertaion until the task is complete/error out/timeout
-    def block_until_complete(self, exportgroup_uri, task_id):
-
-        while(True):
-            out = self.show_task_by_uri(exportgroup_uri, task_id)
+    def exportgroup_tag(self, uri, tags):
+        '''
+        Adds the tags to the export group
+        parameters:
+           uri  : uri of the export group.
+           tags : list of the tags to add.
+        '''
+        common.service_json_request(self.__ipAddr, self.__port, "PUT",
+                                    self.URI_EXPORT_GROUP_TAGS.format(uri),
+                                    json.dumps({'add': tags}))
 
-            if(out):
-                if(out["state"] == "ready"):
-                   break
+    def exportgroup_query_by_tag(self, tag, project, tenant):
+        '''
+        Returns the uri of an active export group of the project that
+        carries the tag, with one search request, or None if there is no
+        such group or the ViPR instance cannot search export groups by tag
+        '''
+        if (not common.is_api_supported(self.__ipAddr, self.__port,
+                                        self.URI_EXPORT_GROUP_SEARCH_BY_TAG)):
+            return None
+        try:
+            (s, h) = common.service_json_request(self.__ipAddr, self.__port, "GET",
+                                                 self.URI_EXPORT_GROUP_SEARCH_BY_TAG.format(urllib.quote(tag)),
+                                                 None)
+        except SOSError as e:
+            if (not common.is_unsupported_api_error(e)):
+                raise e
+            common.set_api_unsupported(self.__ipAddr, self.__port,
+                                       self.URI_EXPORT_GROUP_SEARCH_BY_TAG)
+            return None
+        o = common.json_decode(s)
+        if not o:
+            return None
+        if(tenant == None):
+            tenant = ""
+        projuri = Project(self.__ipAddr, self.__port).project_query(tenant+"/"+project)
+        for resource in common.get_node_value(o, "resource"):
+            entry = ExportGroup.uri_cache.get((self.__ipAddr, self.__port, resource["id"]))
+            if(entry is None):
+                entry = self._fetch_group(resource["id"])
+            if(entry is not None and entry[0] == projuri):
+                return resource["id"]
+        return None
+
+    def _unindex_group(self, uri):
+        entry = ExportGroup.uri_cache.get((self.__ipAddr, self.__port, uri))
+        ExportGroup.uri_cache.invalidate((self.__ipAddr, self.__port, uri))
+        for (projuri, name) in ExportGroup.alias_cache.get((self.__ipAddr, self.__port, uri)) or []:
+            key = (self.__ipAddr, self.__port, projuri, name)
+            if(ExportGroup.name_cache.get(key) == uri):
+                ExportGroup.name_cache.invalidate(key)
+        ExportGroup.alias_cache.invalidate((self.__ipAddr, self.__port, uri))
+        if(entry):
+            (projuri, name, ports, varray_uri) = entry
+            key = (self.__ipAddr, self.__port, projuri, name)
+            if(ExportGroup.name_cache.get(key) == uri):
+                ExportGroup.name_cache.invalidate(key)
+            key = (self.__ipAddr, self.__port, projuri, ports, varray_uri)
+            if(ExportGroup.ports_cache.get(key) == uri):
+                ExportGroup.ports_cache.invalidate(key)
 
-                # if the status of the task is 'error' then raise exception
-                if(out["state"] == "error"):
-                    
-                    raise SOSError(SOSError.VALUE_ERR, "Task: "+ task_id + " is in ERROR state")
 
-            
-            # sleep for a second
-            time.sleep(1)
-        
+    # Blocks the opertaion until the task is complete/error out/timeout
+    def block_until_complete(self, exportgroup_uri, task_id):
+        out = common.TaskWatcher.get(self.__ipAddr, self.__port).watch(
+            lambda: self.show_task_by_uri(exportgroup_uri, task_id),
+            self.timeout).result()
+        if(out is None):
+            raise SOSError(SOSError.SOS_FAILURE_ERR, "Task: "+ task_id + " timed out")
+        if(out["state"] == "error"):
+            raise SOSError(SOSError.VALUE_ERR, "Task: "+ task_id + " is in ERROR state")
         return
     
     
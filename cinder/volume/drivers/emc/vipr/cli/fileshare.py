@@ -20,7 +20,6 @@ import json
 import socket
 import commands
 from common import SOSError
-from threading import Timer
 
 class Fileshare(object):
     '''
@@ -49,7 +48,6 @@ class Fileshare(object):
     URI_TASK_LIST = URI_FILESHARE + '/tasks'
     URI_TASK = URI_TASK_LIST + '/{1}'
     
-    isTimeout = False 
     timeout = 300
  
     def __init__(self, ipAddr, port):
@@ -520,13 +518,21 @@ class Fileshare(object):
         proj = Project(self.__ipAddr, self.__port)
         puri = proj.project_query(pname)
         puri = puri.strip()
-        uris = self.search_fileshares(puri)
+        uri = common.query_by_project_and_name(
+            puri, label, Fileshare.URI_SEARCH_FILESHARES_BY_PROJECT_AND_NAME,
+            self.__ipAddr, self.__port, self._scan_project)
+        if (uri):
+            return uri
+        raise SOSError(SOSError.NOT_FOUND_ERR,
+                       "Filesystem " + label + ": not found")
+
+    def _scan_project(self, project_uri, label):
+        uris = self.search_fileshares(project_uri)
         for uri in uris:
             fileshare = self.show_by_uri(uri)
             if (fileshare and fileshare['name'] == label):
                 return fileshare['id']
-        raise SOSError(SOSError.NOT_FOUND_ERR,
-                       "Filesystem " + label + ": not found")
+        return None
 
     # Mounts the fileshare to the mount_dir
     def mount(self, name, mount_dir):
@@ -555,36 +561,16 @@ class Fileshare(object):
             raise SOSError(SOSError.NOT_FOUND_ERR,
                        "error: Filesystem: " + name + " is not exported. Export it first.")
 
-    # Timeout handler for synchronous operations
-    def timeout_handler(self):
-        self.isTimeout = True
-
-
     # Blocks the opertaion until the task is complete/error out/timeout
     def block_until_complete(self, resource_uri, op_id):
-        self.isTimeout = False 
-        t = Timer(self.timeout, self.timeout_handler)
-        t.start()
-        while(True):
-            #out = self.show_by_uri(id)
-            out = self.show_task_by_uri(resource_uri, op_id)
-            
-            if(out):
-                if(out["state"] == "ready"):
-                    # cancel the timer and return
-                    t.cancel()
-                    break
-                # if the status of the task is 'error' then cancel the timer and raise exception
-                if(out["state"] == "error"):
-                    # cancel the timer
-                    t.cancel()
-                    raise SOSError(SOSError.VALUE_ERR,
-                                   "Task: " + op_id + " is in ERROR state")
-
-            if(self.isTimeout):
-                print "Operation timed out"
-                self.isTimeout = False
-                break
+        out = common.TaskWatcher.get(self.__ipAddr, self.__port).watch(
+            lambda: self.show_task_by_uri(resource_uri, op_id),
+            self.timeout).result()
+        if(out is None):
+            print "Operation timed out"
+        elif(out["state"] == "error"):
+            raise SOSError(SOSError.VALUE_ERR,
+                           "Task: " + op_id + " is in ERROR state")
         return
     
     def list_tasks(self, project_name, fileshare_name=None, task_id=None):
@@ -41,6 +41,15 @@ class HostInitiator(object):
     URI_INITIATOR_DEACTIVATE = "/compute/initiators/{0}/deactivate"
     
     INITIATOR_PROTOCOL_LIST = ['FC', 'iSCSI']
+    
+    # Index of the initiators shared by all HostInitiator objects:
+    # (ipAddr, port, initiator port) -> host uri
+    port_cache = common.TTLCache()
+    # (ipAddr, port, initiator uri) -> (initiator port, host uri), or None
+    # for an inactive initiator
+    uri_cache = common.TTLCache()
+    # (ipAddr, port, tenant) -> {host uri : host name}
+    host_cache = common.TTLCache()
         
     __hostObject = None
     
@@ -107,6 +116,10 @@ class HostInitiator(object):
                                              HostInitiator.URI_HOST_LIST_INITIATORS.format(hostUri),
                                              body)
         o = common.json_decode(s)
+        HostInitiator.port_cache.put((self.__ipAddr, self.__port, portwwn), hostUri)
+        if(o and 'id' in o):
+            HostInitiator.uri_cache.put((self.__ipAddr, self.__port, o['id']),
+                                        (portwwn, hostUri))
         return o
     
     
@@ -146,9 +159,86 @@ class HostInitiator(object):
         (s, h) = common.service_json_request(self.__ipAddr, self.__port, "POST",
                                              HostInitiator.URI_INITIATOR_DEACTIVATE.format(initiator_uri),
                                               None)
+        entry = HostInitiator.uri_cache.get((self.__ipAddr, self.__port, initiator_uri))
+        HostInitiator.uri_cache.invalidate((self.__ipAddr, self.__port, initiator_uri))
+        if(entry):
+            HostInitiator.port_cache.invalidate((self.__ipAddr, self.__port, entry[0]))
         return
     
     
+    '''
+    Returns the name of the host of the tenant to which the initiator port
+    belongs, or None
+    '''
+    def find_host(self, initiatorPort, tenant):
+        hostUri = HostInitiator.port_cache.get((self.__ipAddr, self.__port, initiatorPort))
+        hosts = HostInitiator.host_cache.get((self.__ipAddr, self.__port, tenant))
+        if(hostUri is None or hosts is None or hostUri not in hosts):
+            hosts = self.index_initiators(tenant)
+            hostUri = HostInitiator.port_cache.get((self.__ipAddr, self.__port, initiatorPort))
+        return hosts.get(hostUri)
+    
+    
+    '''
+    Refreshes the initiator index. The ids of all initiators are read with
+    one request and only the initiators not indexed yet are fetched, with
+    bulk requests. Returns the hosts of the tenant by uri.
+    '''
+    def index_initiators(self, tenant):
+        hosts = dict()
+        for host in self.__hostObject.list_by_tenant(tenant):
+            hosts[host['id']] = host['name']
+        HostInitiator.host_cache.put((self.__ipAddr, self.__port, tenant), hosts)
+        
+        if(not common.is_api_supported(self.__ipAddr, self.__port,
+                                       HostInitiator.URI_INITIATOR_DETAILS_BULK)):
+            self.__index_by_host(hosts)
+            return hosts
+        try:
+            (s, h) = common.service_json_request(self.__ipAddr, self.__port, "GET",
+                                                 HostInitiator.URI_INITIATOR_DETAILS_BULK,
+                                                 None)
+        except SOSError as e:
+            if(not common.is_unsupported_api_error(e)):
+                raise e
+            common.set_api_unsupported(self.__ipAddr, self.__port,
+                                       HostInitiator.URI_INITIATOR_DETAILS_BULK)
+            self.__index_by_host(hosts)
+            return hosts
+        o = common.json_decode(s)
+        
+        uris = []
+        for uri in (o and o.get('id')) or []:
+            entry = HostInitiator.uri_cache.get((self.__ipAddr, self.__port, uri))
+            if(entry):
+                HostInitiator.port_cache.put((self.__ipAddr, self.__port, entry[0]), entry[1])
+            elif((self.__ipAddr, self.__port, uri) not in HostInitiator.uri_cache):
+                uris.append(uri)
+        
+        initiators = self.show_by_uris(uris)
+        for uri in uris:
+            # inactive initiators are remembered so that they are not
+            # fetched again; the active ones are indexed below
+            HostInitiator.uri_cache.put((self.__ipAddr, self.__port, uri), None)
+        for initiator in initiators:
+            if(initiator.get('host')):
+                HostInitiator.port_cache.put((self.__ipAddr, self.__port, initiator['initiator_port']),
+                                             initiator['host']['id'])
+                HostInitiator.uri_cache.put((self.__ipAddr, self.__port, initiator['id']),
+                                            (initiator['initiator_port'], initiator['host']['id']))
+        return hosts
+    
+    
+    '''
+    Indexes the initiators of the given hosts, one request per host, for
+    ViPR instances without the bulk API
+    '''
+    def __index_by_host(self, hosts):
+        for hostUri in hosts:
+            for initiator in self.__hostObject.list_initiators(hostUri):
+                HostInitiator.port_cache.put((self.__ipAddr, self.__port, initiator['name']), hostUri)
+    
+    
     '''
     Lists all initiators present in the system
     returns list of initiator elements
@@ -229,23 +319,26 @@ class HostInitiator(object):
     def show(self, initiatorList):        
         initiatorListDetails = []
         if(initiatorList is not None):
-            for initiator in initiatorList:
-                initiatorUri = initiator['id']
-                hostDetail = self.show_by_uri(initiatorUri)
-                if(hostDetail is not None and len(hostDetail)>0):
-                        initiatorListDetails.append(hostDetail)
+            initiatorListDetails = self.show_by_uris(
+                [initiator['id'] for initiator in initiatorList])
         
         return initiatorListDetails
     
+    """
+    Gets details of list of initiator uris with bulk requests
+    """
+    def show_by_uris(self, uris):
+        return common.bulk_get(self.__ipAddr, self.__port,
+                               HostInitiator.URI_INITIATOR_DETAILS_BULK, uris)
+    
     """
     Gets initiator details matching the protocol type
     """
     def show_by_protocol(self, initiatorList, protocol):        
         initiatorListDetails = []
         if(initiatorList is not None):
-            for initiator in initiatorList:
-                initiatorUri = initiator['id']
-                initiatorDetail = self.show_by_uri(initiatorUri)
+            for initiatorDetail in self.show_by_uris(
+                    [initiator['id'] for initiator in initiatorList]):
                 if(initiatorDetail is not None and len(initiatorDetail)>0 and initiatorDetail['protocol'] == protocol):
                         initiatorListDetails.append(initiatorDetail)
         
@@ -32,8 +32,6 @@ from hostinitiators import HostInitiator
 from viprinfo import ViPRInfo
 from viprinfo import retry_wrapper as vipr_retry_wrapper
 
-AUTHENTICATED = False
-
 class Openstack(object):
     '''
     The class definition for operations related to 'Openstack'. 
@@ -30,6 +30,11 @@ class Project(object):
     URI_PROJECT_RESOURCES = '/projects/{0}/resources'
     URI_PROJECT_ACL = '/projects/{0}/acl'
     URI_DEACTIVATE = URI_PROJECT + '/deactivate'
+    URI_PROJECT_BULK = '/projects/bulk'
+    
+    # project uris shared by all Project objects, keyed by
+    # (ipAddr, port, tenant uri, project name)
+    name_cache = common.TTLCache(common.CATALOG_TTL_SEC)
     
     
     def __init__(self, ipAddr, port):
@@ -159,16 +164,33 @@ class Project(object):
         
         try:
             tenant_uri = tenant_obj.tenant_query(tenant_name)
-            projects = self.project_list(tenant_uri)
-            if(projects and len(projects) > 0):
-                for project in projects:
-                    if (project):
-                        project_detail = self.project_show_by_uri(project['id'])
-                        if(project_detail and project_detail['name'] == project_name):
-                            return project_detail['id']
+            key = (self.__ipAddr, self.__port, tenant_uri, project_name)
+            uri = Project.name_cache.get(key)
+            if(uri is None):
+                self.index_projects(tenant_uri)
+                uri = Project.name_cache.get(key)
+            if(uri):
+                return uri
             raise SOSError(SOSError.NOT_FOUND_ERR, 'Project: ' + project_name + ' not found')
         except SOSError as e:
             raise e
+    
+    def index_projects(self, tenant_uri):
+        '''
+        Adds all active projects of a tenant to the name index, with one
+        list request and bulk requests for the project details
+        Parameters:
+            tenant_uri: UUID of the tenant
+        '''
+        ids = [project['id'] for project in self.project_list(tenant_uri) if project]
+        names = dict()
+        for project in common.bulk_get(self.__ipAddr, self.__port,
+                                       Project.URI_PROJECT_BULK, ids):
+            # keep the first project found when names are duplicated
+            if(project['name'] not in names):
+                names[project['name']] = project['id']
+        for (name, uri) in names.items():
+            Project.name_cache.put((self.__ipAddr, self.__port, tenant_uri, name), uri)
         
     
     def project_delete_by_uri(self, uri):
@@ -179,6 +201,8 @@ class Project(object):
         '''
         (s, h) = common.service_json_request(self.__ipAddr, self.__port,
                                              "POST", Project.URI_DEACTIVATE.format(uri), None)
+        Project.name_cache.invalidate_matching(
+            lambda key: key[:2] == (self.__ipAddr, self.__port))
         return
     
     def project_delete(self, name):
@@ -212,6 +236,8 @@ class Project(object):
         
         (s, h) = common.service_json_request(self.__ipAddr, self.__port, "PUT",
                                              Project.URI_PROJECT.format(project_uri), body)
+        Project.name_cache.invalidate_matching(
+            lambda key: key[:2] == (self.__ipAddr, self.__port))
     
     def get_acl(self, project_name):
         
@@ -21,7 +21,7 @@ import volume
 import consistencygroup
 import json
 import time
-from threading import Timer
+import threading
 from common import SOSError
 
 class Snapshot(object):
@@ -46,6 +46,7 @@ class Snapshot(object):
     URI_SNAPSHOT_TASKS_BY_OPID   = '/{0}/snapshots/{1}/tasks/{2}'
     
     URI_RESOURCE_DEACTIVATE      = '{0}/deactivate'
+    URI_SEARCH_SNAPSHOTS_BY_NAME = '/{0}/snapshots/search?name={1}'
     
     URI_CONSISTENCY_GROUP = "/block/consistency-groups"
     URI_CONSISTENCY_GROUPS_SNAPSHOT = URI_CONSISTENCY_GROUP + "/{0}/protection/snapshots"
@@ -63,7 +64,6 @@ class Snapshot(object):
     BLOCK   = 'block'
     OBJECT  = 'object'
  
-    isTimeout = False 
     timeout = 300
     
     def __init__(self, ipAddr, port):
@@ -73,6 +73,9 @@ class Snapshot(object):
         '''
         self.__ipAddr = ipAddr
         self.__port = port
+        self.__cancel = threading.Event()
+        # futures of the tasks being waited for, for cancel()
+        self.__futures = set()
         
     
     def snapshot_create(self, otype, typename, ouri, snaplabel, inactive, rptype, sync):
@@ -223,7 +226,7 @@ class Snapshot(object):
         return o
     def snapshot_delete(self, storageresType, storageresTypename, resourceUri, name, sync):
         snapshotUri = self.snapshot_query(storageresType, storageresTypename, resourceUri, name)
-        self.snapshot_delete_uri(storageresType, resourceUri, snapshotUri, sync)
+        return self.snapshot_delete_uri(storageresType, resourceUri, snapshotUri, sync)
 
     def snapshot_restore(self, storageresType, storageresTypename, resourceUri, name, sync):    
         snapshotUri = self.snapshot_query(storageresType, storageresTypename, resourceUri, name)
@@ -448,6 +451,16 @@ class Snapshot(object):
        
              
     def snapshot_query(self, storageresType, storageresTypename, resuri, snapshotName):
+        if(resuri is not None and storageresTypename != Snapshot.CG):
+            searchUri = Snapshot.URI_SEARCH_SNAPSHOTS_BY_NAME.format(storageresType, '{0}')
+            if(common.is_api_supported(self.__ipAddr, self.__port, searchUri)):
+                try:
+                    return self._search_by_name(storageresType, resuri, snapshotName, searchUri)
+                except SOSError as e:
+                    if(not common.is_unsupported_api_error(e)):
+                        raise e
+                    common.set_api_unsupported(self.__ipAddr, self.__port, searchUri)
+
         if(resuri is not None):
             uris = self.snapshot_list_uri(storageresType, storageresTypename, resuri)
             for uri in uris:
@@ -457,6 +470,19 @@ class Snapshot(object):
                         return snapshot['id']
                 
         raise SOSError(SOSError.SOS_FAILURE_ERR, "snapshot with the name:" + snapshotName + " Not Found")
+
+    def _search_by_name(self, storageresType, resuri, snapshotName, searchUri):
+        '''
+        Searches the snapshots by name; snapshots of other resources that
+        have the same name are skipped by checking their parent
+        '''
+        for uri in common.search_by_name(searchUri, snapshotName, self.__ipAddr, self.__port):
+            snapshot = self.snapshot_show_uri(storageresType, resuri, uri)
+            if(snapshot and False == (common.get_node_value(snapshot, 'inactive'))):
+                parent = common.get_node_value(snapshot, 'parent')
+                if (parent and parent['id'] == resuri):
+                    return snapshot['id']
+        raise SOSError(SOSError.SOS_FAILURE_ERR, "snapshot with the name:" + snapshotName + " Not Found")
   
     def storageResource_query(self, storageresType, fileshareName, volumeName, cgName, project, tenant):
         resourcepath = "/" + project + "/"
@@ -496,36 +522,40 @@ class Snapshot(object):
             storageresTypeName = None
         return (storageresType, storageresTypeName)
     
-    # Timeout handler for synchronous operations
-    def timeout_handler(self):
-        self.isTimeout = True
+    def cancel(self):
+        '''
+        Stops the current and later waits for the tasks of this object;
+        they return without waiting for the tasks to complete
+        '''
+        self.__cancel.set()
+        for future in list(self.__futures):
+            future.cancel()
 
+    def watch_task(self, storageresType, resuri, op_id):
+        '''
+        Returns a TaskFuture for a task of the snapshot
+        '''
+        return common.TaskWatcher.get(self.__ipAddr, self.__port).watch(
+            lambda: self.snapshot_show_task_opid(storageresType, resuri, op_id),
+            self.timeout)
 
     # Blocks the opertaion until the task is complete/error out/timeout
     def block_until_complete(self, storageresType, resuri, op_id):
-        t = Timer(self.timeout, self.timeout_handler)
-        t.start()
-        while(True):
-            #out = self.show_by_uri(id)
-            out = self.snapshot_show_task_opid(storageresType, resuri, op_id)
-            
-            if(out):
-                if(out["state"] == "ready"):
-                    # cancel the timer and return
-                    t.cancel()
-                    break
-                # if the status of the task is 'error' then cancel the timer and raise exception
-                if(out["state"] == "error"):
-                    detail = out["service_error"]
-                    # cancel the timer
-                    t.cancel()
-                    raise SOSError(SOSError.VALUE_ERR, 
-                                   "Task: ["+ op_id +"], "+ detail["details"] )
-
-            if(self.isTimeout):
+        future = self.watch_task(storageresType, resuri, op_id)
+        self.__futures.add(future)
+        if(self.__cancel.is_set()):
+            future.cancel()
+        try:
+            out = future.result()
+        finally:
+            self.__futures.discard(future)
+        if(out is None):
+            if(not self.__cancel.is_set()):
                 print "Operation timed out"
-                self.isTimeout=False
-                break
+        elif(out["state"] == "error"):
+            detail = out["service_error"]
+            raise SOSError(SOSError.VALUE_ERR, 
+                           "Task: ["+ op_id +"], "+ detail["details"] )
         return
 
 
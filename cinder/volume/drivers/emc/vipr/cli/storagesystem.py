@@ -29,6 +29,7 @@ class StorageSystem(object):
     #Commonly used URIs for the 'StorageSystem' module
     URI_STORAGESYSTEM_LIST = '/vdc/storage-systems'
     URI_STORAGESYSTEM_DETAILS = '/vdc/storage-systems/{0}'
+    URI_STORAGESYSTEM_BULK = '/vdc/storage-systems/bulk'
     URI_STORAGESYSTEM_INVENTORY = '/vdc/storage-systems/{0}/physical-inventory'
     
     URI_STORAGESYSTEM_REGISTER = '/vdc/storage-systems/{0}/register'
@@ -343,8 +344,10 @@ class StorageSystem(object):
         '''
         output = []
         systems = self.list_systems()
-        for item in systems:
-            system = self.show_by_uri(item['id'])
+        details = common.bulk_get(self.__ipAddr, self.__port,
+                                  StorageSystem.URI_STORAGESYSTEM_BULK,
+                                  [item['id'] for item in systems])
+        for system in details:
             if(system and system["inactive"] == False): 
                 if(len(attribval) == 0):
                     output.append(system)
@@ -50,6 +50,10 @@ class Tenant(object):
     
     PROVIDER_TENANT = "Provider Tenant"
 
+    # tenant uris shared by all Tenant objects, keyed by
+    # (ipAddr, port, tenant name)
+    name_cache = common.TTLCache(common.CATALOG_TTL_SEC)
+
     def __init__(self, ipAddr, port):
         '''
         Constructor: takes IP address and port of the ViPR instance. These are
@@ -330,6 +334,14 @@ class Tenant(object):
         if (common.is_uri(label)):
             return label
 
+        key = (self.__ipAddr, self.__port, label)
+        uri = Tenant.name_cache.get(key)
+        if (uri is None):
+            uri = self.__tenant_lookup(label)
+            Tenant.name_cache.put(key, uri)
+        return uri
+
+    def __tenant_lookup(self, label):
         id = self.tenant_getid()
 
 	if not label:
@@ -696,6 +708,8 @@ class Tenant(object):
         (s, h) = common.service_json_request(self.__ipAddr, self.__port,
                                          "POST", self.URI_RESOURCE_DEACTIVATE.format(self.URI_TENANTS.format(uri)),
                          		         None)
+        Tenant.name_cache.invalidate_matching(
+            lambda key: key[:2] == (self.__ipAddr, self.__port))
         return 
     
     def tenant_delete(self, label):
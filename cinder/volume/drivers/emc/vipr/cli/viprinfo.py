@@ -16,12 +16,10 @@
 #    under the License.
 
 import ConfigParser
-import os
 
+import common
 from common import SOSError
-from authentication import Authentication
-
-AUTHENTICATED = False
+from authentication import AuthManager
 
 class ViPRInfo(object):
     '''
@@ -68,19 +66,14 @@ class ViPRInfo(object):
         return viprinfo
     
     def authenticate_user(self):       
-        global AUTHENTICATED
-        
-        # we should check to see if we are already authenticated before blindly doing it again
-        if (AUTHENTICATED == False ):
-            obj = Authentication(self._vipr_info['hostname'], int(self._vipr_info['port']))
-            cookiedir = '/tmp/vipr_cookie_dir'
-            cookiefile = 'cookie-' + self._vipr_info['username'] + '-' + str(os.getpid())
-            obj.authenticate_user(self._vipr_info['username'], self._vipr_info['password'], cookiedir, cookiefile)
-            AUTHENTICATED = True
+        auth_manager = AuthManager.get(self._vipr_info['hostname'], int(self._vipr_info['port']),
+                                       self._vipr_info['username'], self._vipr_info['password'],
+                                       '/tmp/vipr_cookie_dir')
+        auth_manager.use()
+        auth_manager.token()
             
 def retry_wrapper(func):
     def try_and_retry(*args, **kwargs):
-        global AUTHENTICATED
         retry = False
         try:
             return func(*args, **kwargs)
@@ -90,12 +83,12 @@ def retry_wrapper(func):
             if (e.err_code == SOSError.HTTP_ERR and
                 (e.err_text.find('401') != -1 or e.err_text.lower().find('cookie') != -1)):
                 retry=True
-                AUTHENTICATED=False
         except Exception as e:
             raise e
  
         print("retry =" + str(retry))   
         if (retry):        
+            common.renew_auth_tokens()
             return func(*args, **kwargs)
     
     return try_and_retry            
@@ -31,6 +31,11 @@ class VirtualArray(object):
     URI_VIRTUALARRAY_ACLS = URI_VIRTUALARRAY_URI + '/acl'
     URI_RESOURCE_DEACTIVATE      = '{0}/deactivate'
     URI_AUTO_TIER_POLICY = "/vdc/varrays/{0}/auto-tier-policies"
+    URI_VIRTUALARRAY_BULK = URI_VIRTUALARRAY + '/bulk'
+
+    # varray uris shared by all VirtualArray objects, keyed by
+    # (ipAddr, port, varray name)
+    name_cache = common.TTLCache(common.CATALOG_TTL_SEC)
 
     
     def __init__(self, ipAddr, port):
@@ -56,19 +61,34 @@ class VirtualArray(object):
         if (common.is_uri(name)):
             return name
 
-        uris = self.varray_list()
-
-        for uri in uris:
-            varray = self.varray_show(uri, False) 
-	    if(varray):
-                if(varray['name'] == name):
-                    return varray['id']
+        key = (self.__ipAddr, self.__port, name)
+        uri = VirtualArray.name_cache.get(key)
+        if (uri is None):
+            self.index_varrays()
+            uri = VirtualArray.name_cache.get(key)
+        if (uri):
+            return uri
     
         raise SOSError(SOSError.NOT_FOUND_ERR, 
                        "varray " + name + ": not found")
 
         
 
+    def index_varrays(self):
+        '''
+        Adds all active varrays to the name index, with one list request and
+        bulk requests for the varray details
+        '''
+        names = dict()
+        for varray in common.bulk_get(self.__ipAddr, self.__port,
+                                      VirtualArray.URI_VIRTUALARRAY_BULK,
+                                      self.varray_list()):
+            # keep the first varray found when names are duplicated
+            if (varray['name'] not in names):
+                names[varray['name']] = varray['id']
+        for (name, uri) in names.items():
+            VirtualArray.name_cache.put((self.__ipAddr, self.__port, name), uri)
+
     def varray_list(self):
         '''
         Returns all the varrays in a vdc
@@ -228,6 +248,8 @@ class VirtualArray(object):
         body = json.dumps(params)
         (s, h) = common.service_json_request(self.__ipAddr, self.__port, "PUT", 
                                                      VirtualArray.URI_VIRTUALARRAY_URI.format(uri) , body)
+        VirtualArray.name_cache.invalidate_matching(
+            lambda key: key[:2] == (self.__ipAddr, self.__port))
         o = common.json_decode(s)
         return o
 
@@ -243,6 +265,8 @@ class VirtualArray(object):
         (s, h) = common.service_json_request(self.__ipAddr, self.__port, "POST", 
 					     self.URI_RESOURCE_DEACTIVATE.format(VirtualArray.URI_VIRTUALARRAY_URI.format(uri)),
                                              None)
+        VirtualArray.name_cache.invalidate_matching(
+            lambda key: key[:2] == (self.__ipAddr, self.__port))
         return str(s) + " ++ " + str(h)
     
 # VIRTUALARRAY Create routines
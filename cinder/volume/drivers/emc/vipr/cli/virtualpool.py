@@ -41,10 +41,15 @@ class VirtualPool(object):
     URI_VPOOL_DEACTIVATE  = URI_VPOOL_SHOW + '/deactivate'
     URI_VPOOL_REFRESH_POOLS = URI_VPOOL_SHOW + "/refresh-matched-pools"
     URI_VPOOL_ASSIGN_POOLS  = URI_VPOOL_SHOW + "/assign-matched-pools"
+    URI_VPOOL_BULK        = URI_VPOOL + "/bulk"
     
     PROTOCOL_TYPE_LIST = ['FC', 'iSCSI', 'NFS', 'CIFS']
     CONDITION_TYPE = ['true', 'false'] 
     
+    # vpool uris shared by all VirtualPool objects, keyed by
+    # (ipAddr, port, type, vpool name)
+    name_cache = common.TTLCache(common.CATALOG_TTL_SEC)
+    
     def __init__(self, ipAddr, port):
         '''
         Constructor: takes IP address and port of the ViPR instance. These are
@@ -64,6 +69,23 @@ class VirtualPool(object):
         o = common.json_decode(s)
         return o['virtualpool']
 
+    def index_vpools(self, type):
+        '''
+        Adds all active VPOOLs of a type to the name index, with one list
+        request and bulk requests for the VPOOL details.
+        parameters:
+             type : Type of the VPOOL { 'file', 'block' or 'object'}
+        '''
+        ids = [vpool['id'] for vpool in self.vpool_list_uris(type)]
+        names = dict()
+        for vpool in common.bulk_get(self.__ipAddr, self.__port,
+                                     self.URI_VPOOL_BULK.format(type), ids):
+            # keep the first VPOOL found when names are duplicated
+            if (vpool['name'] not in names):
+                names[vpool['name']] = vpool['id']
+        for (name, uri) in names.items():
+            VirtualPool.name_cache.put((self.__ipAddr, self.__port, type, name), uri)
+
     def vpool_list(self, type):
         '''
         this function is wrapper to the vpool_list_uris
@@ -545,6 +567,8 @@ class VirtualPool(object):
         body = json.dumps(parms)
         (s, h) = common.service_json_request(self.__ipAddr, self.__port,
                             "PUT", self.URI_VPOOL_SHOW.format(type, vpooluri), body)
+        VirtualPool.name_cache.invalidate_matching(
+            lambda key: key[:2] == (self.__ipAddr, self.__port))
         o = common.json_decode(s)
         return o
 
@@ -562,6 +586,8 @@ class VirtualPool(object):
                                              "POST", 
                                              self.URI_VPOOL_DEACTIVATE.format(type, uri), 
                                              None)
+        VirtualPool.name_cache.invalidate_matching(
+            lambda key: key[:2] == (self.__ipAddr, self.__port))
         return str(s) + " ++ " + str(h)
     
     def vpool_delete(self, name, type):
@@ -583,12 +609,13 @@ class VirtualPool(object):
         if (common.is_uri(name)):
             return name
 
-        uris = self.vpool_list_uris(type)
-        for uri in uris:
-            vpool = common.show_by_href(self.__ipAddr, self.__port, uri)
-	    if(vpool):
-                if (vpool['name'] == name):
-                    return vpool['id']    
+        key = (self.__ipAddr, self.__port, type, name)
+        uri = VirtualPool.name_cache.get(key)
+        if (uri is None):
+            self.index_vpools(type)
+            uri = VirtualPool.name_cache.get(key)
+        if (uri):
+            return uri
         raise SOSError(SOSError.SOS_FAILURE_ERR, "VPOOL " + name + 
 		      " ("+ type + ") " + ": not found")
        
@@ -17,9 +17,8 @@
 
 import common
 import json
-import time
+import urllib
 from common import SOSError
-from threading import Timer
 from virtualarray import VirtualArray
 from storagesystem import StorageSystem
 
@@ -30,8 +29,10 @@ class Volume(object):
     #Commonly used URIs for the 'Volume' module
     URI_SEARCH_VOLUMES = '/block/volumes/search?project={0}'
     URI_SEARCH_VOLUMES_BY_PROJECT_AND_NAME='/block/volumes/search?project={0}&name={1}'
+    URI_SEARCH_VOLUMES_BY_TAG = '/block/volumes/search?tag={0}'
     URI_VOLUMES = '/block/volumes'
     URI_VOLUME = URI_VOLUMES + '/{0}'
+    URI_VOLUMES_BULK = URI_VOLUMES + '/bulk'
     URI_VOLUME_CREATE = URI_VOLUMES + '?project={0}'
     URI_VOLUME_SNAPSHOTS = URI_VOLUME + '/snapshots'
     URI_VOLUME_RESTORE = URI_VOLUME + '/restore'
@@ -77,8 +78,14 @@ class Volume(object):
     #Protection REST APIs - clone  
     URI_VOLUME_PROTECTION_FULLCOPIES =   '/block/volumes/{0}/protection/full-copies'     
        
-    isTimeout = False
     timeout = 300
+
+    # Name to URI index shared by all Volume objects, keyed by
+    # (ipAddr, port, project uri, volume name). The reverse index, keyed by
+    # (ipAddr, port, volume uri), remembers the volumes that were already
+    # inspected so that a miss only shows volumes created since the last scan.
+    name_cache = common.TTLCache()
+    uri_cache = common.TTLCache()
     
     def __init__(self, ipAddr, port):
         '''
@@ -104,12 +111,21 @@ class Volume(object):
         project_uri = proj.project_query(project)
         
         volume_uris = self.search_volumes(project_uri)
-        volumes = []
-        for uri in volume_uris: 
-            volume = self.show_by_uri(uri)
-            if(volume):
-                volumes.append(volume)
+        volumes = self.show_by_uris(volume_uris)
+        for volume in volumes:
+            self._index_volume(project_uri, volume['id'], volume['name'])
         return volumes
+
+    def show_by_uris(self, uris):
+        '''
+        Retrieves the details of several volumes with bulk requests
+        Parameters:
+            uris: uuids of the volumes
+        Returns:
+            List of the details of the active volumes
+        '''
+        return common.bulk_get(self.__ipAddr, self.__port,
+                               Volume.URI_VOLUMES_BULK, uris)
     
     '''
     Given the project name and volume name, the search will be performed to find
@@ -137,6 +153,30 @@ class Volume(object):
             volume_uris.append(resource["id"])
         return volume_uris
     
+    def search_by_tag(self, tag):
+        '''
+        Returns the uris of the volumes that carry the tag, with one search
+        request, or None if the ViPR instance cannot search volumes by tag
+        '''
+        if (not common.is_api_supported(self.__ipAddr, self.__port,
+                                        Volume.URI_SEARCH_VOLUMES_BY_TAG)):
+            return None
+        try:
+            (s, h) = common.service_json_request(self.__ipAddr, self.__port,
+                                                  "GET",
+                                                  Volume.URI_SEARCH_VOLUMES_BY_TAG.format(urllib.quote(tag)),
+                                                  None)
+        except SOSError as e:
+            if (not common.is_unsupported_api_error(e)):
+                raise e
+            common.set_api_unsupported(self.__ipAddr, self.__port,
+                                       Volume.URI_SEARCH_VOLUMES_BY_TAG)
+            return None
+        o = common.json_decode(s)
+        if not o:
+            return []
+        return [resource["id"] for resource in common.get_node_value(o, "resource")]
+    
     #Get the list of volumes given a project uri    
     def list_by_uri(self, project_uri):
         '''
@@ -486,16 +526,21 @@ class Volume(object):
         puri = proj.project_query(pname)
         puri = puri.strip()
               
-        uris = self.search_volumes(puri)
-        
-        for uri in uris:
+        uri = self._lookup(puri, label)
+        volume = None
+        if (uri):
             volume = self.show_by_uri(uri, show_inactive)
-            if (volume and volume['name'] == label):
-                if(not xml):
-                    return volume
-                else:
-                    return self.show_by_uri(volume['id'], 
-                                            show_inactive, xml)
+            if (volume is None or volume['name'] != label):
+                # the indexed volume was deleted or renamed since it was cached
+                self._unindex_volume(uri, puri, label)
+                uri = self._lookup(puri, label)
+                volume = uri and self.show_by_uri(uri, show_inactive)
+        if (volume and volume['name'] == label):
+            if(not xml):
+                return volume
+            else:
+                return self.show_by_uri(volume['id'], 
+                                        show_inactive, xml)
         raise SOSError(SOSError.NOT_FOUND_ERR, "Volume " + 
                         str(label) + ": not found")
     
@@ -645,6 +690,7 @@ class Volume(object):
                                              Volume.URI_VOLUMES,
                                              body)
         o = common.json_decode(s)
+        self._index_tasks(project_uri, o)
         if(sync):
             if(number_of_volumes < 2):
                 #check task empty
@@ -666,7 +712,7 @@ class Volume(object):
             project: name of the project under which the volume will be created
             label: name of volume
             number_of_volumes: count of volumes
-            srcname: name of the source volume
+            srcname: name or uri of the source volume
             sync: synchronous request
         Returns:
             Created task details in JSON response payload
@@ -679,7 +725,10 @@ class Volume(object):
                 
         try:
             self.__find_volumes(project_uri, name, label, number_of_volumes)
-            volume_uri = self.volume_query(project + '/' + srcname)       
+            if(common.is_uri(srcname)):
+                volume_uri = srcname
+            else:
+                volume_uri = self.volume_query(project + '/' + srcname)       
         except SOSError as e:
             raise e                
                 
@@ -698,6 +747,7 @@ class Volume(object):
                                              Volume.URI_VOLUME_PROTECTION_FULLCOPIES.format(volume_uri),
                                              body)
         o = common.json_decode(s)
+        self._index_tasks(project_uri, o)
         if(sync):
             if(number_of_volumes < 2):
                 task = o["task"][0]
@@ -780,6 +830,7 @@ class Volume(object):
                                              "PUT",
                                              Volume.URI_VOLUME.format(volume_uri), 
                                              body)
+        self._unindex_volume(volume_uri)
         o = common.json_decode(s)
         return o
 
@@ -971,6 +1022,7 @@ class Volume(object):
                                              "POST",
                                              Volume.URI_DEACTIVATE.format(uri), 
                                              None)
+        self._unindex_volume(uri)
         if(not s):
             return None
         o = common.json_decode(s)
@@ -991,6 +1043,8 @@ class Volume(object):
                                              "POST",
                                              Volume.URI_BULK_DELETE, 
                                              body)
+        for uri in uris:
+            self._unindex_volume(uri)
         o = common.json_decode(s)
         return o 
  
@@ -1015,49 +1069,96 @@ class Volume(object):
         proj = Project(self.__ipAddr, self.__port)
         puri = proj.project_query(pname)
         puri = puri.strip()
-        uris = self.search_volumes(puri)
-        for uri in uris:
-            volume = self.show_by_uri(uri)
-            if (volume and volume['name'] == label):
-                return volume['id']
+        uri = self._lookup(puri, label)
+        if (uri):
+            return uri
         raise SOSError(SOSError.NOT_FOUND_ERR, "Volume " +
                             label + ": not found")
 
-    # Timeout handler for synchronous operations
-    def timeout_handler(self):
-        self.isTimeout = True
-
+    def _lookup(self, project_uri, label):
+        '''
+        Returns the uri of the volume named label in the given project,
+        or None. On a miss the volume is searched by name, and the project
+        index is refreshed only if the ViPR instance has no name search.
+        '''
+        key = (self.__ipAddr, self.__port, project_uri, label)
+        uri = Volume.name_cache.get(key)
+        if (uri is None):
+            uri = common.query_by_project_and_name(
+                project_uri, label,
+                Volume.URI_SEARCH_VOLUMES_BY_PROJECT_AND_NAME,
+                self.__ipAddr, self.__port, self._scan_project)
+            if (uri):
+                self._index_volume(project_uri, uri, label)
+        return uri
+
+    def _scan_project(self, project_uri, label):
+        self._index_project(project_uri)
+        return Volume.name_cache.get(
+            (self.__ipAddr, self.__port, project_uri, label))
+
+    def _index_project(self, project_uri):
+        '''
+        Adds the volumes of a project to the name index. Volumes that are
+        already indexed are not shown again, so a refresh costs one search
+        plus a bulk request for the volumes created since the previous
+        refresh.
+        '''
+        uris = [uri for uri in self.search_volumes(project_uri)
+                if (self.__ipAddr, self.__port, uri) not in Volume.uri_cache]
+        volumes = self.show_by_uris(uris)
+        for uri in uris:
+            # inactive volumes are remembered so that they are not shown
+            # again; the active ones are indexed below
+            Volume.uri_cache.put((self.__ipAddr, self.__port, uri), None)
+        for volume in volumes:
+            self._index_volume(project_uri, volume['id'], volume['name'])
+
+    def _index_volume(self, project_uri, uri, label):
+        key = (self.__ipAddr, self.__port, project_uri, label)
+        # keep the first volume found when names are duplicated
+        if (key not in Volume.name_cache):
+            Volume.name_cache.put(key, uri)
+        Volume.uri_cache.put((self.__ipAddr, self.__port, uri),
+                             (project_uri, label))
+
+    def _index_tasks(self, project_uri, o):
+        '''
+        Indexes the volumes referenced by the tasks of a create response
+        '''
+        for task in o.get('task', []):
+            resource = task.get('resource')
+            if (resource and 'name' in resource):
+                self._index_volume(project_uri, resource['id'],
+                                   resource['name'])
+
+    def _unindex_volume(self, uri, project_uri=None, label=None):
+        key = (self.__ipAddr, self.__port, uri)
+        entry = Volume.uri_cache.get(key)
+        Volume.uri_cache.invalidate(key)
+        if (entry):
+            (project_uri, label) = entry
+        if (project_uri and label):
+            Volume.name_cache.invalidate((self.__ipAddr, self.__port,
+                                          project_uri, label))
 
     # Blocks the opertaion until the task is complete/error out/timeout
     def block_until_complete(self, volume_uri, task_id):
-        self.isTimeout = False
-        t = Timer(self.timeout, self.timeout_handler)
-        t.start()
-        while(True):
-            out = self.show_task_by_uri(volume_uri, task_id)
-
-            if(out):
-                if(out["state"] == "ready"):
-                    # cancel the timer and return
-                    t.cancel()
-                    break
-
-                # if the status of the task is 'error' then cancel the timer and raise exception
-                if(out["state"] == "error"):
-                    # cancel the timer
-                    t.cancel()
-                    raise SOSError(SOSError.VALUE_ERR, "Task: "+ task_id + " is in ERROR state")
-
-            if(self.isTimeout):
-                print "Operation timed out."
-                self.isTimeout=False
-                break
-	    
-	    # sleep for a second
-	    time.sleep(1)
-	    
+        out = self.watch_task(volume_uri, task_id).result()
+        if(out is None):
+            print "Operation timed out."
+        elif(out["state"] == "error"):
+            raise SOSError(SOSError.VALUE_ERR, "Task: "+ task_id + " is in ERROR state")
         return
     
+    def watch_task(self, volume_uri, task_id):
+        '''
+        Returns a TaskFuture for a task of the volume
+        '''
+        return common.TaskWatcher.get(self.__ipAddr, self.__port).watch(
+            lambda: self.show_task_by_uri(volume_uri, task_id),
+            self.timeout)
+
     def list_tasks(self, project_name, volume_name=None, task_id=None):
         
         from project import Project
@@ -15,13 +15,13 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import json
 import os
 import platform
-import random
-import string
 from oslo.config import cfg
+import threading
+import time
 from threading import Timer
-import time 
 from xml.dom.minidom import parseString
 
 from cinder import context
@@ -29,7 +29,7 @@ from cinder import exception
 from cinder.openstack.common import log as logging
 from cinder.volume import volume_types
 
-from cli.authentication import Authentication
+from cli.authentication import AuthManager
 import cli.common as vipr_utils
 from cli.common import SOSError
 from cli.exportgroup import ExportGroup
@@ -40,6 +40,7 @@ from cli.volume import Volume
 from cli.host import Host
 from cli.hostinitiators import HostInitiator
 from cli.virtualarray import VirtualArray
+from cli.virtualpool import VirtualPool
 
 # for the delegator
 import sys,os,traceback
@@ -69,8 +70,33 @@ volume_opts = [
                default=None,
                help='Virtual Array to utilize within the EMC ViPR Instance'),                  
     cfg.StrOpt('vipr_cookiedir',
-               default='/tmp',
-               help='directory to store temporary cookies, defaults to /tmp')                  
+               default=None,
+               help='directory to also save the auth token in, by default it is only kept in memory'),
+    cfg.IntOpt('vipr_http_pool_size',
+               default=10,
+               help='Number of HTTP connections kept alive to the EMC ViPR Instance'),
+    cfg.BoolOpt('vipr_async_tasks',
+               default=False,
+               help='Return from volume and snapshot create and delete requests once the EMC ViPR Instance accepted them, '
+                    'failures are then reported in the volume or snapshot status'),
+    cfg.IntOpt('vipr_device_discovery_timeout',
+               default=100,
+               help='Seconds to wait for the device number of an attached volume to be known to the EMC ViPR Instance'),
+    cfg.FloatOpt('vipr_attach_batch_window',
+               default=0.5,
+               help='Seconds during which concurrent attaches or detaches of the same host are collected '
+                    'into one export group update, 0 to update it for every volume'),
+    cfg.FloatOpt('vipr_delete_batch_window',
+               default=0.5,
+               help='Seconds during which concurrent volume deletions are collected into one '
+                    'bulk deactivate request, 0 to deactivate every volume on its own'),
+    cfg.IntOpt('vipr_stats_refresh_interval',
+               default=60,
+               help='Seconds between two refreshes of the capacity stats, which are done in the background'),
+    cfg.BoolOpt('vipr_tag_metadata',
+               default=True,
+               help='Besides the cinder volume id, tag the EMC ViPR volumes with the name, display name and '
+                    'project of the cinder volume, packed in a single tag')
     ]
 
 CONF=cfg.CONF
@@ -81,7 +107,6 @@ URI_VPOOL_VARRAY_CAPACITY = '/block/vpools/{0}/varrays/{1}/capacity'
 
 def retry_wrapper(func):
     def try_and_retry(*args, **kwargs):
-        global AUTHENTICATED
         retry = False
         
         try:
@@ -91,7 +116,6 @@ def retry_wrapper(func):
             # the string contains 401 or if the string contains the word cookie
             if (e.err_code == SOSError.HTTP_ERR and (e.err_text.find('401') != -1 or e.err_text.lower().find('cookie') != -1)):
                 retry=True
-                AUTHENTICATED=False
             else:               
                 exception_message = "\nViPR Exception: %s\nStack Trace:\n%s" % (e.err_text,traceback.format_exc())
                 raise exception.VolumeBackendAPIException(data=exception_message)               
@@ -100,22 +124,32 @@ def retry_wrapper(func):
             raise exception.VolumeBackendAPIException(data=exception_message)   
     
         if (retry):        
+            # log in again, unless a concurrent request already did
+            vipr_utils.renew_auth_tokens()
             return func(*args, **kwargs)
     
     return try_and_retry
 
 
-AUTHENTICATED = False
-
 class EMCViPRDriverCommon():
     
     OPENSTACK_TAG = 'OpenStack'
+    # the cinder properties packed in the metadata tag
+    METADATA_TAG_PROPS = ['name', 'display_name', 'project_id']
+    TAG_MAX_LEN = 128
+    # (vipr hostname, vipr port, volume type id) -> (extra specs, vpool uri),
+    # saves a DB query and a vpool lookup per volume create
+    volume_type_cache = vipr_utils.TTLCache(vipr_utils.VOLUME_TYPE_TTL_SEC, maxsize=128)
+    # the capacity of a vpool is fetched at least once in this many stats refreshes
+    STATS_MAX_AGE_INTERVALS = 5
 
-    def __init__(self, protocol, default_backend_name, configuration=None):
+    def __init__(self, protocol, default_backend_name, configuration=None, db=None):
         self.protocol = protocol
         self.configuration = configuration
+        self.db = db
         self.configuration.append_config_values(volume_opts)
-        vipr_utils.COOKIE = None
+        vipr_utils.configure_connection_pool(self.configuration.vipr_hostname, self.configuration.vipr_port,
+                                             self.configuration.vipr_http_pool_size)
 
         # instantiate a few vipr cli objects for later use
         self.volume_obj = Volume(self.configuration.vipr_hostname, self.configuration.vipr_port)
@@ -131,6 +165,30 @@ class EMCViPRDriverCommon():
                  'total_capacity_gb': 'unknown',
                  'vendor_name': 'EMC',
                  'volume_backend_name': self.configuration.volume_backend_name or default_backend_name}
+
+        # the stats are refreshed by a background thread, started on the first request
+        self._stats_thread = None
+        self._stats_lock = threading.Lock()
+        # (capacity, fetch time) of each (vpool uri, varray uri) pair, and
+        # the names of the vpools volumes were created in since the last refresh
+        self._capacities = {}
+        self._dirty_vpools = set()
+
+        # futures of the tasks started in async mode, keyed by (resource type, cinder id);
+        # display names are not unique
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+
+        # attaches for the same host set up its host, initiators and export group one at a time
+        self._host_locks = vipr_utils.KeyedLock()
+        # volumes attached concurrently are added to their export group together
+        self._attach_batcher = vipr_utils.Batcher(self._add_volumes_to_exportgroup,
+                                                  self.configuration.vipr_attach_batch_window)
+        self._detach_batcher = vipr_utils.Batcher(self._remove_volumes_from_exportgroup,
+                                                  self.configuration.vipr_attach_batch_window)
+        # volumes deleted concurrently are deactivated with one bulk request
+        self._delete_batcher = vipr_utils.Batcher(self._deactivate_volumes,
+                                                  self.configuration.vipr_delete_batch_window)
         
     def check_for_setup_error(self):
         # validate all of the vipr_* configuration values
@@ -166,16 +224,31 @@ class EMCViPRDriverCommon():
         if (self.configuration.rpc_response_timeout is None or self.configuration.rpc_response_timeout<300):
             LOG.warn(_("rpc_response_time should be set to at least 300 seconds"))
 
+        self._prefetch_catalog()
+
+    def _prefetch_catalog(self):
+        '''
+        Resolves the configured tenant, project and varray and all block
+        vpools once, so that volume operations find them in the catalog
+        '''
+        try:
+            self.authenticate_user()
+            Project(self.configuration.vipr_hostname, self.configuration.vipr_port).project_query(
+                self.configuration.vipr_tenant + "/" + self.configuration.vipr_project)
+            self.varray_obj.varray_query(self.configuration.vipr_varray)
+            VirtualPool(self.configuration.vipr_hostname, self.configuration.vipr_port).index_vpools("block")
+        except SOSError as e:
+            # the lookups are retried on demand by the volume operations
+            LOG.warn(_("Could not prefetch the ViPR catalog: %s") % e.err_text)
+
     def authenticate_user(self):       
-        global AUTHENTICATED
-        
-        # we should check to see if we are already authenticated before blindly doing it again
-        if (AUTHENTICATED == False ):
-            obj = Authentication(self.configuration.vipr_hostname, self.configuration.vipr_port)
-            # cookiedir = os.getcwd()
-            cookiedir=self.configuration.vipr_cookiedir
-            obj.authenticate_user(self.configuration.vipr_username, self.configuration.vipr_password, cookiedir, None)
-            AUTHENTICATED = True
+        # the token is shared by the backends using the same ViPR user, and
+        # is only requested again when it expires
+        auth_manager = AuthManager.get(self.configuration.vipr_hostname, self.configuration.vipr_port,
+                                       self.configuration.vipr_username, self.configuration.vipr_password,
+                                       self.configuration.vipr_cookiedir)
+        auth_manager.use()
+        auth_manager.token()
 
     @retry_wrapper
     def create_volume(self, vol):
@@ -186,7 +259,7 @@ class EMCViPRDriverCommon():
             
         size = int(vol['size']) * 1073741824
 
-        vpool = self._get_vpool(vol)
+        (vpool, vpool_uri) = self._get_vpool_and_uri(vol)
         self.vpool = vpool['ViPR:VPOOL']
 
         try:
@@ -194,9 +267,9 @@ class EMCViPRDriverCommon():
                              name,
                              size,
                              self.configuration.vipr_varray,
-                             self.vpool,
+                             vpool_uri,
                              protocol=None, # no longer specified in volume creation
-                             sync=True,
+                             sync=False, # the task is waited for below
                              number_of_volumes=1,
                              thin_provisioned=None, # no longer specified in volume creation
                              protection=None,
@@ -204,6 +277,9 @@ class EMCViPRDriverCommon():
                              consistent_volume_label=None,
                              consistencygroup=None
                              )
+            model_update = self._complete_volume_task(vol, name, res)
+            self._mark_vpool_dirty(self.vpool)
+            return model_update
         except SOSError as e:
             if(e.err_code == SOSError.SOS_FAILURE_ERR):
                 raise SOSError(SOSError.SOS_FAILURE_ERR, "Volume " +
@@ -212,59 +288,97 @@ class EMCViPRDriverCommon():
                 raise e
                             
     @retry_wrapper
-    def setTags(self, vol):
+    def setTags(self, vol, model_update=None, new_volume=False, read_back=False):
+        '''
+        Tags the ViPR volume with the properties of the cinder volume.
+        model_update is the update returned by create, which holds the
+        uri of the volume before it is stored in the cinder database.
+        The OpenStack tags are synchronized with a single request; the
+        current tags are not read for a new volume, which has none.
+        Returns the tags of the volume if read_back is set.
+        '''
     
-        self.authenticate_user()
         name = self._get_volume_name(vol)        
-                
-        # first, get the current tags that start with the OPENSTACK_TAG eyecatcher
-        removeTags=[]
-        currentTags = self.volume_obj.getTags(self.configuration.vipr_tenant + "/" + self.configuration.vipr_project + "/" + name)
-        for cTag in currentTags:
-            if (cTag.startswith(self.OPENSTACK_TAG)):
-                removeTags.append(cTag)
+        # in async mode the volume is tagged once it is created
+        if (self._defer_to_task(('volume', vol['id']),
+                                lambda: self.setTags(vol, model_update, new_volume, read_back))):
+            return
 
+        self.authenticate_user()
+        volume_uri = self._get_volume_uri(vol, model_update)
+
+        # the current tags that start with the OPENSTACK_TAG eyecatcher
+        currentTags = set()
+        if (not new_volume):
+            for cTag in self.volume_obj.getTags(volume_uri):
+                if (cTag.startswith(self.OPENSTACK_TAG)):
+                    currentTags.add(cTag)
+
+        tags = self._get_openstack_tags(vol)
+        addTags = list(tags - currentTags)
+        removeTags = list(currentTags - tags)
         try:
-            if (len(removeTags)>0):
-                self.volume_obj.modifyTags(self.configuration.vipr_tenant + "/" + self.configuration.vipr_project + "/" + name, None, removeTags)
-        except SOSError as e:
-            if (e.err_code == SOSError.SOS_FAILURE_ERR):
-                LOG.debug("SOSError adding the tag: " + e.err_text)
-        
-        
-        # now add the tags for the volume
-        addTags=[]
-        # put all the openstack volume properties into the ViPR volume
-        for prop, value in vars(vol).iteritems():
-            try:
-                # don't put the status in, it's always the status before the current transaction
-                if (not prop.startswith("status")):
-                    addTags.append(self.OPENSTACK_TAG+":"+prop+":"+value)
-            except Exception:
-                pass
-        
-        try:
-            self.volume_obj.modifyTags(self.configuration.vipr_tenant + "/" + self.configuration.vipr_project + "/" + name, addTags, None)
+            if (addTags or removeTags):
+                self.volume_obj.modifyTags(volume_uri, addTags or None, removeTags or None)
         except SOSError as e:
             if (e.err_code == SOSError.SOS_FAILURE_ERR):
                 LOG.debug("SOSError adding the tag: " + e.err_text)
                 
-        return self.volume_obj.getTags(self.configuration.vipr_tenant + "/" + self.configuration.vipr_project + "/" + name)    
+        if (read_back):
+            return self.volume_obj.getTags(volume_uri)
+
+    def _get_openstack_tags(self, vol):
+        '''
+        Returns the set of tags that put the openstack volume into the ViPR
+        volume: the cinder volume id, which find_volume_uri searches for,
+        and optionally a metadata tag like
+        OpenStack:meta:{"display_name":"vol1","name":"volume-<id>",...}
+        '''
+        tags = set([self.OPENSTACK_TAG + ":id:" + vol['id']])
+        if (self.configuration.vipr_tag_metadata):
+            meta = {}
+            for prop in self.METADATA_TAG_PROPS:
+                try:
+                    if (vol[prop]):
+                        meta[prop] = vol[prop]
+                except (KeyError, AttributeError):
+                    pass
+            tag = self.OPENSTACK_TAG + ":meta:" + json.dumps(meta, sort_keys=True, separators=(',', ':'))
+            if (len(tag) > self.TAG_MAX_LEN and 'display_name' in meta):
+                # display names can be long, the other properties are ids
+                del meta['display_name']
+                tag = self.OPENSTACK_TAG + ":meta:" + json.dumps(meta, sort_keys=True, separators=(',', ':'))
+            tags.add(tag)
+        return tags
+
+    def find_volume_uri(self, volume_id):
+        '''
+        Returns the uri of the ViPR volume of a cinder volume id, looked up
+        through its id tag with a single search, or None if there is no
+        such volume or the ViPR instance cannot search by tag
+        '''
+        uris = self.volume_obj.search_by_tag(self.OPENSTACK_TAG + ":id:" + volume_id)
+        if (uris):
+            return uris[0]
+        return None
 
     @retry_wrapper
     def create_cloned_volume(self, vol, src_vref):
         """Creates a clone of the specified volume."""        
         self.authenticate_user()
         name = self._get_volume_name(vol)
-        srcname = self._get_volume_name(src_vref)
+        self._wait_for_task(('volume', src_vref['id']))
         
         try:
             res = self.volume_obj.clone(self.configuration.vipr_tenant + "/" + self.configuration.vipr_project,
                              name,
                              number_of_volumes=1,
-                             srcname=srcname,
-                             sync=True
+                             srcname=self._get_volume_uri(src_vref),
+                             sync=False # the task is waited for below
                              )
+            model_update = self._complete_volume_task(vol, name, res)
+            self._mark_volume_vpool_dirty(vol)
+            return model_update
         except SOSError as e:
             if(e.err_code == SOSError.SOS_FAILURE_ERR):
                 raise SOSError(SOSError.SOS_FAILURE_ERR, "Volume " +
@@ -276,10 +390,26 @@ class EMCViPRDriverCommon():
     def delete_volume(self, vol):
         self.authenticate_user()
         name = self._get_volume_name(vol)
+        self._wait_for_task(('volume', vol['id']))
         try:
-            self.volume_obj.delete(self.configuration.vipr_tenant + "/" + self.configuration.vipr_project + "/" + name, volume_name_list=None, sync=True)
+            volume_uri = self._get_volume_uri(vol)
+            if (self.configuration.vipr_delete_batch_window > 0):
+                res = self._delete_batcher.submit('volumes', volume_uri).get(volume_uri)
+                if (isinstance(res, SOSError)):
+                    raise res
+            else:
+                res = self.volume_obj.delete_by_uri(volume_uri)
+            if (res and self.configuration.vipr_async_tasks):
+                # the volume is gone from cinder, a failure can only be logged
+                self._track_task(('volume', vol['id']),
+                                 self.volume_obj.watch_task(res['resource']['id'], res['op_id']),
+                                 lambda: None)
+            elif (res):
+                self.volume_obj.block_until_complete(res['resource']['id'], res['op_id'])
+            self._mark_volume_vpool_dirty(vol)
         except SOSError as e:
-            if e.err_code == SOSError.NOT_FOUND_ERR:
+            if (e.err_code == SOSError.NOT_FOUND_ERR or
+                (e.err_code == SOSError.HTTP_ERR and e.err_text.find("HTTP code: 404") != -1)):
                 LOG.info("Volume " + name + " no longer exists; volume deletion is considered success.")
             elif e.err_code == SOSError.SOS_FAILURE_ERR:
                 raise SOSError(SOSError.SOS_FAILURE_ERR, "Volume " +
@@ -287,6 +417,37 @@ class EMCViPRDriverCommon():
             else:
                 raise e
 
+    def _deactivate_volumes(self, key, volume_uris):
+        '''
+        Deactivates the volumes with one bulk request. If the bulk request
+        fails, for example because one of the volumes is gone, the volumes
+        are deactivated one by one; so are the volumes the bulk request
+        returned no task for.
+        Returns:
+            the deactivate task, or the SOSError, of each volume uri
+        '''
+        volume_uris = list(set(volume_uris))
+        results = {}
+        pending = volume_uris
+        if (len(volume_uris) > 1):
+            try:
+                o = self.volume_obj.delete_bulk_uris(volume_uris)
+                for task in o.get('task', []):
+                    results[task['resource']['id']] = task
+                pending = [volume_uri for volume_uri in volume_uris if volume_uri not in results]
+                if (pending):
+                    LOG.debug("Bulk deactivate returned no task for %d volume(s), deactivating them one by one"
+                              % len(pending))
+            except SOSError as e:
+                LOG.debug("Bulk deactivate of %d volumes failed, deactivating them one by one: %s"
+                          % (len(volume_uris), e.err_text))
+        for volume_uri in pending:
+            try:
+                results[volume_uri] = self.volume_obj.delete_by_uri(volume_uri)
+            except SOSError as e:
+                results[volume_uri] = e
+        return results
+
     @retry_wrapper
     def list_volume(self):
         try:
@@ -310,15 +471,19 @@ class EMCViPRDriverCommon():
             snapshotname = snapshot['name']
             vol = snapshot['volume']
             volumename = self._get_volume_name(vol)
-            projectname = self.configuration.vipr_project
-            tenantname = self.configuration.vipr_tenant
+            self._wait_for_task(('volume', vol['id']))
             storageresType = 'block'
             storageresTypename = 'volumes'
-            resourceUri = obj.storageResource_query(storageresType, fileshareName=None, volumeName=volumename, cgName=None, project=projectname, tenant=tenantname)
+            resourceUri = self._get_volume_uri(vol)
             inactive = False
             rptype = None
-            sync = True
-            obj.snapshot_create(storageresType, storageresTypename, resourceUri, snapshotname, inactive, rptype, sync)
+            sync = not self.configuration.vipr_async_tasks
+            res = obj.snapshot_create(storageresType, storageresTypename, resourceUri, snapshotname, inactive, rptype, sync)
+            if (not sync):
+                task = res['task'][0]
+                self._track_task(('snapshot', snapshot['id']),
+                                 obj.watch_task(storageresType, task['resource']['id'], task['op_id']),
+                                 lambda: self._set_error_status(snapshot, is_snapshot=True))
             return
 
         except SOSError as e:
@@ -334,16 +499,20 @@ class EMCViPRDriverCommon():
         snapshotname = snapshot['name']
         try:
             vol = snapshot['volume']
-            volumename = self._get_volume_name(vol)
-            projectname = self.configuration.vipr_project
-            tenantname = self.configuration.vipr_tenant
             storageresType = 'block'
             storageresTypename = 'volumes'
-            resourceUri = obj.storageResource_query(storageresType, fileshareName=None, volumeName=volumename, cgName=None, project=projectname, tenant=tenantname)
+            resourceUri = self._get_volume_uri(vol)
             if resourceUri is None:
                 LOG.info("Snapshot " + snapshotname + " is not found; snapshot deletion is considered successful.")
             else:
-                obj.snapshot_delete(storageresType, storageresTypename, resourceUri, snapshotname, sync=True)
+                self._wait_for_task(('snapshot', snapshot['id']))
+                res = obj.snapshot_delete(storageresType, storageresTypename, resourceUri, snapshotname,
+                                          sync=not self.configuration.vipr_async_tasks)
+                if (self.configuration.vipr_async_tasks):
+                    # the snapshot is gone from cinder, a failure can only be logged
+                    self._track_task(('snapshot', snapshot['id']),
+                                     obj.watch_task(storageresType, res['resource']['id'], res['op_id']),
+                                     lambda: None)
             return
         except SOSError as e:
             if (e.err_code == SOSError.SOS_FAILURE_ERR):
@@ -357,46 +526,125 @@ class EMCViPRDriverCommon():
         try:
             self.authenticate_user()
             volumename = self._get_volume_name(volume)          
-            foundgroupname = self._find_exportgroup(initiatorPorts)
-            if (foundgroupname is None):
-                for i in xrange(len(initiatorPorts)):
-                    # check if this initiator is contained in any ViPR Host object
-                    LOG.debug("checking for initiator port:" + initiatorPorts[i])
-                    foundhostname= self._find_host(initiatorPorts[i])
-                    if (foundhostname is None):
-                        hostfound = self._host_exists(hostname)
-                        if ( hostfound is None):
-                            # create a host so it can be added to the export group
-                            hostfound = hostname
-                            self.host_obj.create(hostname, platform.system(), hostname, self.configuration.vipr_tenant, project=None, port=None, username=None, passwd=None, usessl=None, osversion=None, cluster=None, datacenter=None, vcenter=None)
-                            LOG.info("Created host " + hostname)
-                        # add the initiator to the host 
-                        self.hostinitiator_obj.create(hostfound, protocol, initiatorNodes[i], initiatorPorts[i]);
-                        LOG.info("Initiator " + initiatorPorts[i] + " added to host " + hostfound)
-                        foundhostname = hostfound
-                    else:
-                        LOG.info("Found host " + foundhostname)
-                    # create an export group for this host
-                    foundgroupname = foundhostname + 'SG'
-                    # create a unique name
-                    foundgroupname = foundgroupname + '-' + ''.join(random.choice(string.ascii_uppercase + string.digits) for x in range(6))
-                    res = self.exportgroup_obj.exportgroup_create(foundgroupname, self.configuration.vipr_project, self.configuration.vipr_tenant, self.configuration.vipr_varray, 'Host', foundhostname);
+            self._wait_for_task(('volume', volume['id']))
+            exportgroup_uri = self._get_or_create_exportgroup(protocol, initiatorNodes, initiatorPorts, hostname)
             LOG.debug("adding the volume to the exportgroup : " +volumename)
-            res = self.exportgroup_obj.exportgroup_add_volumes(foundgroupname, self.configuration.vipr_tenant, self.configuration.vipr_project, volumename, None, None,None, True)
+            volume_uri = self._get_volume_uri(volume)
+            error = self._add_volume_to_exportgroup(exportgroup_uri, volume_uri)
+            if (error is not None and vipr_utils.is_not_found_error(error)):
+                # the export group was deleted since it was indexed
+                LOG.info("Exportgroup " + exportgroup_uri + " not found, looking up the exportgroup of " + hostname + " again")
+                exportgroup_uri = self._get_or_create_exportgroup(protocol, initiatorNodes, initiatorPorts, hostname)
+                error = self._add_volume_to_exportgroup(exportgroup_uri, volume_uri)
+            if (error is not None):
+                raise error
             return self._find_device_info(volume, initiatorPorts)
 
         except SOSError as e:
             raise SOSError(SOSError.SOS_FAILURE_ERR, "Attach volume (" + self._get_volume_name(volume) + ") to host (" + hostname + ") initiator (" + initiatorPorts[0] + ") failed: " + e.err_text)
 
+    def _get_or_create_exportgroup(self, protocol, initiatorNodes, initiatorPorts, hostname):
+        ''' Returns the uri of the export group of the host, created if needed '''
+        exportgroup_uri = self._resolve_exportgroup(initiatorPorts, hostname)
+        if (exportgroup_uri is None):
+            with self._host_locks.hold(hostname):
+                # a concurrent attach for the same host may have set it up meanwhile
+                exportgroup_uri = self._resolve_exportgroup(initiatorPorts, hostname)
+                if (exportgroup_uri is None):
+                    exportgroup_uri = self._create_exportgroup(protocol, initiatorNodes, initiatorPorts, hostname)
+        return exportgroup_uri
+
+    def _add_volume_to_exportgroup(self, exportgroup_uri, volume_uri):
+        '''
+        Adds the volume to the export group, coalesced with the adds of
+        concurrent attaches. Returns None, or the SOSError of the add.
+        '''
+        if (self.configuration.vipr_attach_batch_window > 0):
+            return self._attach_batcher.submit(exportgroup_uri, volume_uri).get(volume_uri)
+        return self._add_volumes_to_exportgroup(exportgroup_uri, [volume_uri]).get(volume_uri)
+
+    def _create_exportgroup(self, protocol, initiatorNodes, initiatorPorts, hostname):
+        '''
+        Creates the host and initiators that do not exist yet, and an export
+        group for the host. Returns the uri of the group. The caller holds
+        the lock of the host.
+        '''
+        foundhostname = None
+        for i in xrange(len(initiatorPorts)):
+            # check if this initiator is contained in any ViPR Host object
+            LOG.debug("checking for initiator port:" + initiatorPorts[i])
+            foundhostname= self._find_host(initiatorPorts[i])
+            if (foundhostname is None):
+                hostfound = self._host_exists(hostname)
+                if ( hostfound is None):
+                    # create a host so it can be added to the export group
+                    hostfound = hostname
+                    self.host_obj.create(hostname, platform.system(), hostname, self.configuration.vipr_tenant, project=None, port=None, username=None, passwd=None, usessl=None, osversion=None, cluster=None, datacenter=None, vcenter=None)
+                    LOG.info("Created host " + hostname)
+                # add the initiator to the host 
+                self.hostinitiator_obj.create(hostfound, protocol, initiatorNodes[i], initiatorPorts[i]);
+                LOG.info("Initiator " + initiatorPorts[i] + " added to host " + hostfound)
+                foundhostname = hostfound
+            else:
+                LOG.info("Found host " + foundhostname)
+        # create one export group for the host, with all of its initiators
+        foundgroupname = self._get_exportgroup_name(hostname)
+        try:
+            self.exportgroup_obj.exportgroup_create(foundgroupname, self.configuration.vipr_project, self.configuration.vipr_tenant, self.configuration.vipr_varray, 'Host', foundhostname);
+            return self.exportgroup_obj.exportgroup_query(foundgroupname, self.configuration.vipr_project, self.configuration.vipr_tenant)
+        except SOSError as e:
+            # created meanwhile by another cinder volume service, or before
+            # the host got new initiators
+            if (e.err_code != SOSError.ENTRY_ALREADY_EXISTS_ERR):
+                raise e
+            LOG.info("Export group " + foundgroupname + " already exists")
+        exportgroup_uri = self.exportgroup_obj.exportgroup_query(foundgroupname, self.configuration.vipr_project, self.configuration.vipr_tenant)
+        ports = self.exportgroup_obj.exportgroup_initiator_ports(exportgroup_uri) or frozenset()
+        for port in initiatorPorts:
+            if (port not in ports):
+                LOG.info("Adding initiator " + port + " to exportgroup " + foundgroupname)
+                res = self.exportgroup_obj.exportgroup_add_initiator(exportgroup_uri, self.configuration.vipr_tenant,
+                                                                     self.configuration.vipr_project, port, foundhostname)
+                self.exportgroup_obj.block_until_complete(exportgroup_uri, res['op_id'])
+        return exportgroup_uri
+
+    def _add_volumes_to_exportgroup(self, exportgroup_uri, volume_uris):
+        '''
+        Adds the volumes to the export group with one update, and waits for
+        its task. If the update fails, the volumes are added one by one, so
+        that a rejected volume does not fail the attach of the others.
+        Returns:
+            None, or the SOSError, of each volume uri
+        '''
+        return self._change_exportgroup_volumes(exportgroup_uri, volume_uris,
+                                                self.exportgroup_obj.exportgroup_add_volumes_by_uri, "adding")
+
+    def _change_exportgroup_volumes(self, exportgroup_uri, volume_uris, change, action):
+        volume_uris = list(set(volume_uris))
+        LOG.debug("%s %d volume(s), exportgroup %s" % (action, len(volume_uris), exportgroup_uri))
+        results = {}
+        if (len(volume_uris) > 1):
+            try:
+                change(exportgroup_uri, volume_uris, True)
+                return dict((volume_uri, None) for volume_uri in volume_uris)
+            except SOSError as e:
+                LOG.debug("Update of %d volumes of the exportgroup %s failed, updating them one by one: %s"
+                          % (len(volume_uris), exportgroup_uri, e.err_text))
+        for volume_uri in volume_uris:
+            try:
+                change(exportgroup_uri, [volume_uri], True)
+                results[volume_uri] = None
+            except SOSError as e:
+                results[volume_uri] = e
+        return results
+
     @retry_wrapper
     def terminate_connection(self, volume, 
             protocol, initiatorNodes, initiatorPorts, hostname):
         try:
             self.authenticate_user()
             volumename = self._get_volume_name(volume)
-            tenantproject = self.configuration.vipr_tenant+ '/' + self.configuration.vipr_project
-            voldetails = self.volume_obj.show(tenantproject + '/' + volumename)
-            volid = voldetails['id']
+            volid = self._get_volume_uri(volume)
             
             # find the exportgroups
             exports = self.volume_obj.get_exports_by_uri(volid)
@@ -406,14 +654,57 @@ class EMCViPRDriverCommon():
                 if (itl_port in initiatorPorts):
                     exportgroups.add(itl['export']['id'])
             
-            for exportgroup in exportgroups:
-                res = self.exportgroup_obj.exportgroup_remove_volumes_by_uri(exportgroup, volid, True, None, None, None, None)
+            if (exportgroups):
+                self._remove_from_exportgroups(volid, list(exportgroups))
             else:
                 LOG.info("No export group found for the host: " + hostname + "; this is considered already detached.")
                 
         except SOSError as e:
             raise SOSError(SOSError.SOS_FAILURE_ERR, "Detaching volume " + volumename + " from host " + hostname + " failed: " + e.err_text)
 
+    def _remove_from_exportgroups(self, volume_uri, exportgroup_uris):
+        '''
+        Removes the volume from the export groups, in parallel. The removals
+        from the same export group are coalesced with those of concurrent
+        detaches.
+        '''
+        errors = []
+
+        def remove(exportgroup_uri):
+            try:
+                # the auth token is bound to the thread
+                self.authenticate_user()
+                if (self.configuration.vipr_attach_batch_window > 0):
+                    error = self._detach_batcher.submit(exportgroup_uri, volume_uri).get(volume_uri)
+                else:
+                    error = self._remove_volumes_from_exportgroup(exportgroup_uri, [volume_uri]).get(volume_uri)
+                if (error is not None and vipr_utils.is_not_found_error(error)):
+                    LOG.info("Exportgroup " + exportgroup_uri + " not found; the volume is considered detached from it")
+                elif (error is not None):
+                    raise error
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=remove, args=(exportgroup_uri,))
+                   for exportgroup_uri in exportgroup_uris[1:]]
+        for thread in threads:
+            thread.start()
+        remove(exportgroup_uris[0])
+        for thread in threads:
+            thread.join()
+        if (errors):
+            raise errors[0]
+
+    def _remove_volumes_from_exportgroup(self, exportgroup_uri, volume_uris):
+        '''
+        Removes the volumes from the export group with one update, and waits
+        for its task. If the update fails, the volumes are removed one by one.
+        Returns:
+            None, or the SOSError, of each volume uri
+        '''
+        return self._change_exportgroup_volumes(exportgroup_uri, volume_uris,
+                                                self.exportgroup_obj.exportgroup_remove_volumes_by_uri, "removing")
+
     @retry_wrapper
     def _find_device_info(self, volume, initiator_ports):
         '''
@@ -439,16 +730,16 @@ class EMCViPRDriverCommon():
                 ]
         '''
         volumename = self._get_volume_name(volume)
-        fullname = self.configuration.vipr_project + '/' + volumename
-        vol_uri = self.volume_obj.volume_query(fullname)
+        vol_uri = self._get_volume_uri(volume)
         
         '''
         The itl info shall be available at the first try since now export is a 
-        synchronous call.  We are trying a few more times to accommodate any 
-        delay on filling in the itl info after the export task is completed.
+        synchronous call.  We are retrying, quickly at first and then less
+        often, to accommodate any delay on filling in the itl info after the
+        export task is completed, until vipr_device_discovery_timeout.
         '''
-        itls = []
-        for x in xrange(10):
+        def find_itls():
+            itls = []
             exports = self.volume_obj.get_exports_by_uri(vol_uri)
             LOG.debug(_("Volume exports: %s") % exports)
             for itl in exports['itl']:
@@ -460,19 +751,115 @@ class EMCViPRDriverCommon():
                         # Only loop if it is None or -1
                         LOG.debug(_("Found Device Number: %(found_device_number)s") % (locals()))
                         itls.append(itl)
+            if not itls:
+                LOG.debug(_("Device Number not found yet. Retrying..."))
+            return itls
+
+        itls = vipr_utils.poll_until(find_itls, self.configuration.vipr_device_discovery_timeout)
             
-            if itls:
-                break
-            else:
-                LOG.debug(_("Device Number not found yet. Retrying after 10 seconds..."))
-                time.sleep(10)
-            
-        if itls is None:
-            # No device number found after 10 tries; return an empty itl
-            LOG.info(_("No device number has been found after 10 tries; this likely indicates an unsuccessful attach of volume %(volumename) to initiator %(initiatorPort).") % (locals()))
+        if not itls:
+            # No device number found in time; return an empty itl
+            LOG.info(_("No device number has been found after %(timeout)s seconds; this likely indicates an "
+                       "unsuccessful attach of volume %(volumename)s to initiator %(initiator_ports)s.")
+                     % {'timeout': self.configuration.vipr_device_discovery_timeout,
+                        'volumename': volumename, 'initiator_ports': initiator_ports})
             
         return itls
     
+    def _track_task(self, key, future, on_failure):
+        '''
+        Follows a task started in async mode. Operations on the resource
+        wait for the task through _wait_for_task, and on_failure is called,
+        in its own thread, if the task fails or times out.
+        '''
+        with self._pending_lock:
+            self._pending[key] = future
+
+        def complete(future):
+            with self._pending_lock:
+                if (self._pending.get(key) is future):
+                    del self._pending[key]
+            try:
+                task = future.result()
+                if (task is None):
+                    reason = "timed out"
+                elif (task['state'] == 'error'):
+                    reason = task.get('message', '')
+                else:
+                    return
+            except SOSError as e:
+                reason = e.err_text
+            LOG.error(_("ViPR task of %(type)s %(id)s failed: %(reason)s")
+                      % {'type': key[0], 'id': key[1], 'reason': reason})
+            self._run_in_background(on_failure, key)
+
+        future.add_done_callback(complete)
+
+    def _defer_to_task(self, key, fn):
+        '''
+        Calls fn, in its own thread, once the pending async task of a
+        resource succeeds. Returns False, without calling fn, if there is
+        no such task.
+        '''
+        with self._pending_lock:
+            future = self._pending.get(key)
+        if (future is None):
+            return False
+
+        def run(future):
+            try:
+                task = future.result()
+            except SOSError:
+                return
+            if (task and task['state'] == 'ready'):
+                self._run_in_background(fn, key)
+
+        future.add_done_callback(run)
+        return True
+
+    def _run_in_background(self, fn, key):
+        '''
+        Runs fn in a new thread and logs its failure. The callbacks of the
+        task futures must not block the TaskWatcher scheduler with
+        requests of their own.
+        '''
+        def run():
+            try:
+                fn()
+            except Exception as e:
+                LOG.error(_("Follow-up of the ViPR task of %(type)s %(id)s failed: %(err)s")
+                          % {'type': key[0], 'id': key[1], 'err': e})
+
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+
+    def _wait_for_task(self, key):
+        '''
+        Waits for the pending async task of a resource, if any. Its
+        failure was already reported by _track_task.
+        '''
+        with self._pending_lock:
+            future = self._pending.get(key)
+        if (future):
+            try:
+                future.result()
+            except SOSError:
+                pass
+
+    def _set_error_status(self, resource, is_snapshot=False):
+        if (self.db is None):
+            return
+        try:
+            ctxt = context.get_admin_context()
+            if (is_snapshot):
+                self.db.snapshot_update(ctxt, resource['id'], {'status': 'error'})
+            else:
+                self.db.volume_update(ctxt, resource['id'], {'status': 'error'})
+        except Exception as e:
+            LOG.error(_("Failed to set the status of %(id)s to error: %(err)s")
+                      % {'id': resource['id'], 'err': e})
+
     def _get_volume_name(self, vol):
         try:
             name = vol['display_name']
@@ -484,6 +871,66 @@ class EMCViPRDriverCommon():
             
         return name
     
+    def _get_volume_uri(self, vol, model_update=None):
+        '''
+        Returns the uri of the ViPR volume. Volumes created by this driver
+        keep it in provider_location; others are looked up by name.
+        '''
+        uri = None
+        if (model_update):
+            uri = model_update.get('provider_location')
+        if (uri is None):
+            try:
+                uri = vol['provider_location']
+            except (KeyError, AttributeError):
+                uri = None
+        if (vipr_utils.is_uri(uri)):
+            return uri
+        # volumes created before their uri was kept are found by their
+        # id tag, which is exact even when display names are duplicated
+        uri = self.find_volume_uri(vol['id'])
+        if (uri):
+            return uri
+        return self.volume_obj.volume_query(self.configuration.vipr_tenant + "/" + self.configuration.vipr_project
+                                            + "/" + self._get_volume_name(vol))
+
+    def _complete_volume_task(self, vol, name, res):
+        '''
+        Waits for the task of a volume create or clone, or tracks it in
+        async mode. Returns the model update with the uri of the volume.
+        '''
+        if (len(res.get('task', [])) == 0):
+            raise SOSError(SOSError.SOS_FAILURE_ERR, "error: task list is empty, no task response found")
+        task = res['task'][0]
+        volume_uri = task['resource']['id']
+        if (self.configuration.vipr_async_tasks):
+            self._track_task(('volume', vol['id']),
+                             self.volume_obj.watch_task(volume_uri, task['op_id']),
+                             lambda: self._set_error_status(vol))
+        else:
+            self.volume_obj.block_until_complete(volume_uri, task['op_id'])
+        return {'provider_location': volume_uri}
+
+    def _get_vpool_and_uri(self, volume):
+        '''
+        Returns the extra specs of the volume type of the volume and the
+        uri of their vpool, cached by volume type for VOLUME_TYPE_TTL_SEC
+        '''
+        type_id = volume['volume_type_id']
+        # the vpool uri belongs to the ViPR instance of this backend
+        key = (self.configuration.vipr_hostname, self.configuration.vipr_port, type_id)
+        cached = EMCViPRDriverCommon.volume_type_cache.get(key)
+        if (cached is not None):
+            return (dict(cached[0]), cached[1])
+        vpool = self._get_vpool(volume)
+        if ('ViPR:VPOOL' not in vpool):
+            # not cached, the caller fails on the missing vpool
+            return (vpool, None)
+        vpool_obj = VirtualPool(self.configuration.vipr_hostname, self.configuration.vipr_port)
+        vpool_uri = vpool_obj.vpool_query(vpool['ViPR:VPOOL'], "block")
+        EMCViPRDriverCommon.volume_type_cache.put(key, (dict(vpool), vpool_uri))
+        return (vpool, vpool_uri)
+
     def _get_vpool(self, volume):
         vpool = {}
         ctxt = context.get_admin_context()
@@ -496,56 +943,98 @@ class EMCViPRDriverCommon():
 
         return vpool
 
+    def _get_exportgroup_name(self, hostname):
+        ''' Returns the name of the export group of the host in vipr_varray '''
+        varray = ''.join(c if (c.isalnum() or c in '-_.') else '_'
+                         for c in self.configuration.vipr_varray)
+        return hostname + 'SG-' + varray
+
+    def _resolve_exportgroup(self, initiator_ports, hostname):
+        '''
+        Returns the uri of the export group of the host, or None. It is
+        looked up by its name, which takes a single request and is cached.
+        A group that lacks some of the initiator ports is not returned, so
+        that the caller registers them. Groups created with a random name by
+        earlier versions of the driver are found by their initiators and
+        are then adopted under the name: they are tagged with it in ViPR,
+        so that the next lookups, also after a restart, find them by name
+        or by tag.
+        '''
+        groupname = self._get_exportgroup_name(hostname)
+        foundgroupuri = self._find_exportgroup_by_name(groupname)
+        if (foundgroupuri is None):
+            foundgroupuri = self._find_exportgroup_by_tag(groupname)
+        if (foundgroupuri is not None):
+            ports = self.exportgroup_obj.exportgroup_initiator_ports(foundgroupuri)
+            if (ports is None or not set(initiator_ports) <= ports):
+                LOG.info("Exportgroup " + groupname + " lacks some of the initiators " + str(initiator_ports))
+                return None
+            return foundgroupuri
+
+        foundgroupuri = self._find_exportgroup(initiator_ports)
+        if (foundgroupuri is not None):
+            LOG.info("Adopting exportgroup " + foundgroupuri + " as " + groupname)
+            self._adopt_exportgroup(groupname, foundgroupuri)
+        return foundgroupuri
+
+    def _get_exportgroup_tag(self, groupname):
+        return self.OPENSTACK_TAG + ":exportgroup:" + groupname
+
+    @retry_wrapper
+    def _adopt_exportgroup(self, groupname, exportgroup_uri):
+        ''' Makes the lookups of the export group name find the group '''
+        self.exportgroup_obj.exportgroup_alias(groupname, exportgroup_uri,
+                                               self.configuration.vipr_project, self.configuration.vipr_tenant)
+        try:
+            self.exportgroup_obj.exportgroup_tag(exportgroup_uri, [self._get_exportgroup_tag(groupname)])
+        except SOSError as e:
+            # the group is found by its initiators again after a restart
+            LOG.warn(_("Tagging exportgroup %(uri)s failed: %(err)s") % {'uri': exportgroup_uri, 'err': e.err_text})
+
+    @retry_wrapper
+    def _find_exportgroup_by_tag(self, groupname):
+        '''
+        Returns the uri of the export group adopted under the name, or None.
+        The group is then found by name until the alias expires.
+        '''
+        foundgroupuri = self.exportgroup_obj.exportgroup_query_by_tag(self._get_exportgroup_tag(groupname),
+                                                                      self.configuration.vipr_project,
+                                                                      self.configuration.vipr_tenant)
+        if (foundgroupuri is not None):
+            LOG.debug("Found exportgroup " + foundgroupuri + " adopted as " + groupname)
+            self.exportgroup_obj.exportgroup_alias(groupname, foundgroupuri,
+                                                   self.configuration.vipr_project, self.configuration.vipr_tenant)
+        return foundgroupuri
+
+    @retry_wrapper
+    def _find_exportgroup_by_name(self, name):
+        ''' Returns the uri of the export group with the given name, or None '''
+        try:
+            foundgroupuri = self.exportgroup_obj.exportgroup_query(name, self.configuration.vipr_project,
+                                                                   self.configuration.vipr_tenant)
+        except SOSError as e:
+            if (e.err_code == SOSError.NOT_FOUND_ERR):
+                return None
+            raise e
+        LOG.debug("Found exportgroup " + foundgroupuri)
+        return foundgroupuri
+
     @retry_wrapper
     def _find_exportgroup(self, initiator_ports):
         '''
-        Find the export group to which the given initiator ports are the same as the initiators in the group
-        '''
-        foundgroupname = None
-        grouplist = self.exportgroup_obj.exportgroup_list(self.configuration.vipr_project, self.configuration.vipr_tenant)
-        for groupid in grouplist:
-            groupdetails = self.exportgroup_obj.exportgroup_show(groupid, self.configuration.vipr_project, self.configuration.vipr_tenant)
-            if groupdetails is not None:
-                if (groupdetails['inactive']):
-                    continue
-                initiators = groupdetails['initiators']
-                if initiators is not None:
-                    inits_eg = set()
-                    for initiator in initiators:
-                        inits_eg.add(initiator['initiator_port'])
-                        
-                    if (inits_eg == set(initiator_ports)):
-                        foundgroupname = groupdetails['name']
-                    if foundgroupname is not None:
-                        # Check the associated varray
-                        if groupdetails['varray']:
-                            varray_uri = groupdetails['varray']['id']
-                            varray_details = self.varray_obj.varray_show(varray_uri)
-                            if (varray_details['name'] == self.configuration.vipr_varray):
-                                LOG.debug("Found exportgroup " + foundgroupname)
-                                break
-                        
-                        # Not the right varray
-                        foundgroupname = None
-
-        return foundgroupname
+        Find the export group to which the given initiator ports are the same as the initiators in the group.
+        Returns the uri of the group, looked up in the export group index of the project.
+        '''
+        foundgroupuri = self.exportgroup_obj.exportgroup_find(initiator_ports, self.configuration.vipr_varray,
+                                            self.configuration.vipr_project, self.configuration.vipr_tenant)
+        if foundgroupuri is not None:
+            LOG.debug("Found exportgroup " + foundgroupuri)
+        return foundgroupuri
 
     @retry_wrapper
     def _find_host(self, initiator_port):
         ''' Find the host, if exists, to which the given initiator belong. '''
-        foundhostname = None
-        hosts = self.host_obj.list_by_tenant(self.configuration.vipr_tenant)
-        for host in hosts:
-            initiators = self.host_obj.list_initiators(host['id'])
-            for initiator in initiators:
-                if (initiator_port == initiator['name']):
-                    foundhostname = host['name']
-                    break
-
-            if foundhostname is not None:
-                break
-
-        return foundhostname
+        return self.hostinitiator_obj.find_host(initiator_port, self.configuration.vipr_tenant)
 
     @retry_wrapper
     def _host_exists(self, host_name):
@@ -562,46 +1051,155 @@ class EMCViPRDriverCommon():
         return None
 
 
-    @retry_wrapper
     def update_volume_stats(self):
-        """Retrieve stats info."""
+        """Retrieve stats info.
+
+        Returns the stats of the latest refresh right away; the capacities
+        are refreshed by a background thread every
+        vipr_stats_refresh_interval seconds.
+        """
+        with self._stats_lock:
+            if (self._stats_thread is None):
+                self._stats_thread = threading.Thread(target=self._refresh_stats_forever)
+                self._stats_thread.daemon = True
+                self._stats_thread.start()
+        return self.stats
+
+    def _refresh_stats_forever(self):
+        while (True):
+            try:
+                self._refresh_stats()
+            except Exception as e:
+                # keep the previous stats until the next refresh
+                LOG.error(_("Updating volume stats failed: %s") % e)
+            time.sleep(self.configuration.vipr_stats_refresh_interval)
+
+    @retry_wrapper
+    def _refresh_stats(self):
+        '''
+        Reports one pool per vpool this backend creates volumes in: the
+        vpools of the volume types of the backend, in vipr_varray, and
+        their sum as the backend capacity. A tick only fetches the
+        capacities of the vpools a volume was created in since the previous
+        tick, of new vpools and of those fetched more than
+        STATS_MAX_AGE_INTERVALS intervals ago. They are fetched concurrently,
+        so the cost depends neither on the number of volumes nor, mostly,
+        on the number of vpools.
+        '''
         LOG.debug(_("Updating volume stats"))
         self.authenticate_user()
- 
+        vpairs = self._get_vpool_varray_pairs()
+
+        with self._stats_lock:
+            dirty = self._dirty_vpools
+            self._dirty_vpools = set()
+        max_age = self.STATS_MAX_AGE_INTERVALS * self.configuration.vipr_stats_refresh_interval
+        now = time.time()
+        stale = [vpair for (vpair, vpool_name) in vpairs.items()
+                 if (vpair not in self._capacities or vpool_name in dirty or
+                     self._capacities[vpair][1] + max_age <= now)]
+
+        errors = []
+
+        def fetch(vpair):
+            try:
+                # the auth token is bound to the thread
+                self.authenticate_user()
+                (s, h) = vipr_utils.service_json_request(self.configuration.vipr_hostname, self.configuration.vipr_port,
+                              "GET",
+                              URI_VPOOL_VARRAY_CAPACITY.format(vpair[0], vpair[1]),
+                              body=None)
+                self._capacities[vpair] = (vipr_utils.json_decode(s), time.time())
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=fetch, args=(vpair,)) for vpair in stale]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # forget the vpools no volume type uses any more
+        for vpair in self._capacities.keys():
+            if (vpair not in vpairs):
+                del self._capacities[vpair]
+        if (errors):
+            with self._stats_lock:
+                self._dirty_vpools.update(dirty)
+            raise errors[0]
+        if (len(vpairs) == 0):
+            return
+
+        pools = []
+        free_gb = 0.0
+        used_gb = 0.0
+        provisioned_gb = 0.0
+        for (vpair, vpool_name) in sorted(vpairs.items()):
+            capacity = self._capacities[vpair][0]
+            pool = {'pool_name': vpool_name,
+                    'free_capacity_gb': float(capacity["free_gb"]),
+                    'total_capacity_gb': float(capacity["free_gb"]) + float(capacity["used_gb"]),
+                    'provisioned_capacity_gb': float(capacity["provisioned_gb"]),
+                    'reserved_percentage': 0,
+                    'QoS_support': False}
+            pools.append(pool)
+            free_gb += float(capacity["free_gb"])
+            used_gb += float(capacity["used_gb"])
+            provisioned_gb += float(capacity["provisioned_gb"])
+
+        stats = dict(self.stats)
+        stats['pools'] = pools
+        stats['free_capacity_gb'] = free_gb
+        stats['total_capacity_gb'] = free_gb + used_gb
+        if (free_gb + used_gb > 0):
+            stats['reserved_percentage'] = 100 * provisioned_gb/(free_gb + used_gb)
+        # replaced as a whole, so readers never see a partial update
+        self.stats = stats
+
+    def _mark_vpool_dirty(self, vpool_name):
+        ''' Makes the next stats refresh fetch the capacity of the vpool '''
+        with self._stats_lock:
+            self._dirty_vpools.add(vpool_name)
+
+    def _mark_volume_vpool_dirty(self, vol):
+        '''
+        Makes the next stats refresh fetch the capacity of the vpool of the
+        volume, if its volume type is cached; otherwise the capacity is
+        refreshed when it ages out
+        '''
         try:
-            vols = self.volume_obj.list_volumes(self.configuration.vipr_tenant + "/" + self.configuration.vipr_project)
-            vpairs = set()            
-            if (len(vols) > 0):
-                for vol in vols:
-                    if(vol):              
-                        vpair = (vol["vpool"]["id"], vol["varray"]["id"])
-                        if (vpair not in vpairs):
-                            vpairs.add(vpair)
-
-            if (len(vpairs) > 0):            
-                free_gb = 0.0
-                used_gb = 0.0
-                provisioned_gb = 0.0
-                precent_used = 0.0
-                percent_provisioned = 0.0            
-                for vpair in vpairs:            
-                    if(vpair): 
-                        (s, h) = vipr_utils.service_json_request(self.configuration.vipr_hostname, self.configuration.vipr_port,
-                                      "GET",
-                                      URI_VPOOL_VARRAY_CAPACITY.format(vpair[0], vpair[1]),
-                                      body=None)
-                        capacity = vipr_utils.json_decode(s)
-                        
-                        free_gb += float(capacity["free_gb"])
-                        used_gb += float(capacity["used_gb"])
-                        provisioned_gb += float(capacity["provisioned_gb"])
-                        
-                self.stats['free_capacity_gb'] = free_gb
-                self.stats['total_capacity_gb'] = free_gb + used_gb
-                self.stats['reserved_percentage'] = 100 * provisioned_gb/(free_gb + used_gb)
-
-            return self.stats
+            key = (self.configuration.vipr_hostname, self.configuration.vipr_port, vol['volume_type_id'])
+            cached = EMCViPRDriverCommon.volume_type_cache.get(key)
+            if (cached is not None and cached[0].get('ViPR:VPOOL')):
+                self._mark_vpool_dirty(cached[0]['ViPR:VPOOL'])
+        except Exception as e:
+            # only delays the capacity update of the vpool
+            LOG.debug("Marking the vpool of volume %s failed: %s" % (vol.get('id'), e))
 
-        except SOSError as e:
-            raise e
+    def _get_vpool_varray_pairs(self):
+        '''
+        Returns the vpool names of the volume types of this backend, keyed
+        by the (vpool uri, varray uri) pair. Types whose vpool is not found
+        are skipped.
+        '''
+        backend_name = self.stats['volume_backend_name']
+        varray_uri = self.varray_obj.varray_query(self.configuration.vipr_varray)
+        vpool_obj = VirtualPool(self.configuration.vipr_hostname, self.configuration.vipr_port)
+        vpairs = {}
+        ctxt = context.get_admin_context()
+        for volume_type in volume_types.get_all_types(ctxt).values():
+            specs = volume_type.get('extra_specs') or {}
+            if ('ViPR:VPOOL' not in specs):
+                continue
+            if (specs.get('volume_backend_name', backend_name) != backend_name):
+                continue
+            try:
+                vpool_uri = vpool_obj.vpool_query(specs['ViPR:VPOOL'], "block")
+            except SOSError as e:
+                if (e.err_code == SOSError.HTTP_ERR):
+                    raise e
+                # a misconfigured volume type must not stop the stats of the others
+                LOG.warn(_("Volume type %(type)s: %(err)s") % {'type': volume_type.get('name'), 'err': e.err_text})
+                continue
+            vpairs[(vpool_uri, varray_uri)] = specs['ViPR:VPOOL']
+        return vpairs
 
@@ -41,20 +41,23 @@ class EMCViPRISCSIDriver(driver.ISCSIDriver):
         self.common = EMCViPRDriverCommon(
                         protocol='iSCSI',
                         default_backend_name=self.__class__.__name__,
-                        configuration=self.configuration)
+                        configuration=self.configuration,
+                        db=self.db)
 
     def check_for_setup_error(self):
         self.common.check_for_setup_error()
 
     def create_volume(self, volume):
         """Creates a Volume. """
-        self.common.create_volume(volume)
-        self.common.setTags(volume)
+        model_update = self.common.create_volume(volume)
+        self.common.setTags(volume, model_update, new_volume=True)
+        return model_update
 
     def create_cloned_volume(self, volume, src_vref):
         """Creates a cloned Volume."""
-        self.common.create_cloned_volume(volume, src_vref)
-        self.common.setTags(volume)                
+        model_update = self.common.create_cloned_volume(volume, src_vref)
+        self.common.setTags(volume, model_update)
+        return model_update                
         
     def create_volume_from_snapshot(self, volume, snapshot):
         """Creates a volume from a snapshot."""
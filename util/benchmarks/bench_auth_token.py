@@ -0,0 +1,130 @@
+#!/usr/bin/python
+
+# Copyright (c) 2013 EMC Corporation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+'''
+Measures the per request overhead of getting the auth token: read from
+the cookie files for each request, as before the in-memory token store,
+or from the token store and from an AuthManager. The token lookup alone
+and a whole common.service_json_request are timed; the HTTP session is
+replaced by a mock that answers at once, so no ViPR instance is needed.
+
+usage: bench_auth_token.py [number of requests]
+'''
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# the cli modules import each other as top level modules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', '..', 'cinder', 'volume', 'drivers', 'emc', 'vipr', 'cli'))
+
+import common
+from authentication import Authentication
+from authentication import AuthManager
+
+IP_ADDR = 'vipr.mock'
+PORT = 4443
+TOKEN = 'BAAcY1Rz' * 32
+
+
+class MockResponse(object):
+    status_code = 200
+    text = '{}'
+    headers = {}
+
+
+class MockSession(object):
+    '''
+    Answers every request at once
+    '''
+    def request(self, url, **kwargs):
+        return MockResponse()
+
+    get = post = put = delete = request
+
+
+def setup_cookie_files(install_dir):
+    '''
+    Lays out the cookie files as the authenticate command of the CLI does:
+    a pointer file named after the process id that holds the path of the
+    file with the token
+    '''
+    os.mkdir(os.path.join(install_dir, 'cookie'))
+    tokenfile = os.path.join(install_dir, 'cookie', 'token')
+    with open(tokenfile, 'w') as f:
+        f.write(TOKEN)
+    with open(os.path.join(install_dir, 'cookie', str(os.getpid())), 'w') as f:
+        f.write(tokenfile + '\n')
+    os.environ['VIPR_CLI_INSTALL_DIR'] = install_dir
+
+
+def measure(fn, count):
+    start = time.time()
+    for i in xrange(count):
+        fn()
+    return 1e6 * (time.time() - start) / count
+
+
+def main():
+    count = 20000
+    if (len(sys.argv) > 1):
+        count = int(sys.argv[1])
+
+    install_dir = tempfile.mkdtemp()
+    try:
+        setup_cookie_files(install_dir)
+        common.SESSIONS[(IP_ADDR, str(PORT))] = MockSession()
+        Authentication.login = lambda self, username, password: TOKEN
+        manager = AuthManager.get(IP_ADDR, PORT, 'user', 'password')
+        manager.use()
+
+        def request():
+            common.service_json_request(IP_ADDR, PORT, 'GET', '/block/volumes/bench', None)
+
+        get_auth_token = common.get_auth_token
+        rows = []
+
+        # before: the token is read from the cookie files for each request
+        common.get_auth_token = lambda ip_addr, port: common.read_cookie_file()
+        rows.append(('cookie files', measure(lambda: common.get_auth_token(IP_ADDR, PORT), count),
+                     measure(request, count)))
+        common.get_auth_token = get_auth_token
+
+        # no manager for the thread, the token comes from the store
+        common.use_auth_manager(IP_ADDR, PORT, None)
+        common.TOKENS.put(IP_ADDR, PORT, TOKEN)
+        rows.append(('token store', measure(lambda: common.get_auth_token(IP_ADDR, PORT), count),
+                     measure(request, count)))
+
+        manager.use()
+        rows.append(('auth manager', measure(lambda: common.get_auth_token(IP_ADDR, PORT), count),
+                     measure(request, count)))
+    finally:
+        shutil.rmtree(install_dir)
+
+    print 'Auth token overhead per request, %d requests' % count
+    print '  %-14s %16s %18s' % ('token from', 'lookup (usec)', 'request (usec)')
+    for row in rows:
+        print '  %-14s %16.2f %18.2f' % row
+    print '  overhead removed: %.2f usec per request' % (rows[0][2] - rows[2][2])
+
+
+if __name__ == '__main__':
+    main()
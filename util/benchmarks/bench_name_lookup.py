@@ -0,0 +1,141 @@
+#!/usr/bin/python
+
+# Copyright (c) 2013 EMC Corporation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+'''
+Counts the REST calls made by Volume.volume_query to resolve volume names,
+against a mocked ViPR instance holding a project of 10k volumes. Both the
+server side ?project=&name= search and the fallback for ViPR instances
+without it, which indexes the project, are measured. No ViPR instance is
+needed: common.service_json_request is replaced by the mock.
+
+usage: bench_name_lookup.py [number of volumes] [number of lookups]
+'''
+
+import json
+import os
+import sys
+import time
+import urllib
+import urlparse
+
+# the cli modules import each other as top level modules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', '..', 'cinder', 'volume', 'drivers', 'emc', 'vipr', 'cli'))
+
+import common
+from common import SOSError
+from project import Project
+from volume import Volume
+
+IP_ADDR = 'vipr.mock'
+PORT = 4443
+PROJECT = 'tenant/project'
+PROJECT_URI = 'urn:storageos:Project:bench:'
+
+
+class MockViPR(object):
+    '''
+    Answers the volume search, show and bulk requests of a project
+    '''
+    def __init__(self, count, name_search=True):
+        self.name_search = name_search
+        self.calls = 0
+        self.volumes = {}
+        for i in xrange(count):
+            uri = 'urn:storageos:Volume:%08d:' % i
+            self.volumes[uri] = {'id': uri, 'name': 'volume-%d' % i,
+                                 'inactive': False,
+                                 'project': {'id': PROJECT_URI}}
+
+    def request(self, ip_addr, port, http_method, uri, body, token=None,
+                xml=False, contenttype='application/json', filename=None,
+                customheaders=None, apitype=None):
+        self.calls += 1
+        (path, query) = urllib.splitquery(uri)
+        params = dict(urlparse.parse_qsl(query or ''))
+        if (path == '/block/volumes/search' and 'name' in params):
+            if (not self.name_search):
+                raise SOSError(SOSError.HTTP_ERR, "SOS is reporting an error: HTTP code: 405")
+            return self._resources([v for v in self.volumes.values()
+                                    if v['name'] == params['name']])
+        if (path == '/block/volumes/search'):
+            return self._resources(self.volumes.values())
+        if (path == '/block/volumes/bulk' and http_method == 'POST'):
+            ids = json.loads(body)['id']
+            return (json.dumps({'volume': [self.volumes[id] for id in ids
+                                           if id in self.volumes]}), {})
+        if (path.startswith('/block/volumes/')):
+            volume = self.volumes.get(path.rsplit('/', 1)[1])
+            if (volume is None):
+                raise SOSError(SOSError.HTTP_ERR, "SOS is reporting an error: HTTP code: 404")
+            return (json.dumps(volume), {})
+        raise SOSError(SOSError.HTTP_ERR, "SOS is reporting an error: HTTP code: 404")
+
+    def _resources(self, volumes):
+        return (json.dumps({'resource': [{'id': v['id'], 'match': v['name']}
+                                         for v in volumes]}), {})
+
+
+def reset():
+    Volume.name_cache.clear()
+    Volume.uri_cache.clear()
+    common.UNSUPPORTED_APIS.clear()
+
+
+def run(title, mock, names):
+    reset()
+    common.service_json_request = mock.request
+    # only the volume lookups are measured
+    Project.project_query = lambda self, name: PROJECT_URI
+    volume_obj = Volume(IP_ADDR, PORT)
+    rows = []
+    for (label, batch) in [('first lookup', names[:1]),
+                           ('same name again', names[:1]),
+                           ('other names', names[1:])]:
+        mock.calls = 0
+        start = time.time()
+        for name in batch:
+            volume_obj.volume_query(PROJECT + '/' + name)
+        elapsed = time.time() - start
+        rows.append((label, len(batch), mock.calls,
+                     float(mock.calls) / len(batch), 1000 * elapsed / len(batch)))
+    print title
+    print '  %-16s %8s %8s %10s %10s' % ('', 'lookups', 'calls', 'calls/lkp', 'ms/lkp')
+    for row in rows:
+        print '  %-16s %8d %8d %10.2f %10.3f' % row
+    print
+
+
+def main():
+    count = 10000
+    lookups = 100
+    if (len(sys.argv) > 1):
+        count = int(sys.argv[1])
+    if (len(sys.argv) > 2):
+        lookups = int(sys.argv[2])
+    step = max(1, count / lookups)
+    names = ['volume-%d' % i for i in xrange(0, count, step)][:lookups]
+
+    print 'Volume name lookups in a project of %d volumes' % count
+    print '(the list-and-scan lookup took 1 search plus %d shows per lookup)' % count
+    print
+    run('server side name search', MockViPR(count), names)
+    run('no name search: the project is indexed', MockViPR(count, name_search=False), names)
+
+
+if __name__ == '__main__':
+    main()
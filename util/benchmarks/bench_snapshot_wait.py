@@ -0,0 +1,116 @@
+#!/usr/bin/python
+
+# Copyright (c) 2013 EMC Corporation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+'''
+Regression benchmark for Snapshot.block_until_complete: counts the
+requests per second sent to ViPR while waiting for simulated snapshot
+tasks that take 30 seconds, by default one. The busy waiting loop this
+replaced sent requests as fast as ViPR answered them. No ViPR instance is
+needed: common.service_json_request is replaced by a mock that answers
+the task requests.
+
+usage: bench_snapshot_wait.py [task duration in seconds] [number of snapshots]
+'''
+
+import json
+import os
+import sys
+import threading
+import time
+
+# the cli modules import each other as top level modules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', '..', 'cinder', 'volume', 'drivers', 'emc', 'vipr', 'cli'))
+
+import common
+from common import SOSError
+from snapshot import Snapshot
+
+IP_ADDR = 'vipr.mock'
+PORT = 4443
+
+
+class MockViPR(object):
+    '''
+    Answers the task requests of snapshots whose tasks are ready duration
+    seconds after the mock is created
+    '''
+    def __init__(self, duration):
+        self.start = time.time()
+        self.ready_at = self.start + duration
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def task(self, op_id):
+        state = 'pending'
+        if (time.time() >= self.ready_at):
+            state = 'ready'
+        return {'id': 'urn:storageos:Task:%s:' % op_id, 'op_id': op_id, 'state': state}
+
+    def request(self, ip_addr, port, http_method, uri, body, token=None,
+                xml=False, contenttype='application/json', filename=None,
+                customheaders=None, apitype=None):
+        with self.lock:
+            self.requests.append(time.time() - self.start)
+        if (uri == '/vdc/tasks/bulk' and http_method == 'POST'):
+            ids = json.loads(body)['id']
+            return (json.dumps({'task': [self.task(id.split(':')[3]) for id in ids]}), {})
+        if (uri.startswith('/block/snapshots/') and '/tasks/' in uri):
+            return (json.dumps(self.task(uri.rsplit('/', 1)[1])), {})
+        raise SOSError(SOSError.HTTP_ERR, "SOS is reporting an error: HTTP code: 404")
+
+
+def main():
+    duration = 30.0
+    snapshots = 1
+    if (len(sys.argv) > 1):
+        duration = float(sys.argv[1])
+    if (len(sys.argv) > 2):
+        snapshots = int(sys.argv[2])
+
+    mock = MockViPR(duration)
+    common.service_json_request = mock.request
+    done = []
+
+    def wait(i):
+        Snapshot(IP_ADDR, PORT).block_until_complete(
+            'block', 'urn:storageos:BlockSnapshot:%d:' % i, 'op%d' % i)
+        done.append(time.time() - mock.start)
+
+    threads = [threading.Thread(target=wait, args=(i,)) for i in xrange(snapshots)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # let the TaskWatcher scheduler thread exit before the interpreter does
+    time.sleep(0.5)
+
+    waited = max(done)
+    per_second = [0] * (int(waited) + 1)
+    for t in mock.requests:
+        per_second[min(int(t), int(waited))] += 1
+    print 'Waiting for %d snapshot task(s) of %.0f seconds' % (snapshots, duration)
+    print '  requests:          %d' % len(mock.requests)
+    print '  requests/second:   %.2f average, %d peak' % (len(mock.requests) / waited,
+                                                          max(per_second))
+    print '  completed after:   %.2f seconds (latest)' % waited
+    print '  requests in each second of the wait:'
+    print '   ', ' '.join(str(n) for n in per_second)
+
+
+if __name__ == '__main__':
+    main()